@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import sys
+import tempfile
+import contextlib
+
+from standins import start_standins, stop_standins, standin_env
+
+## Checks of create-dmp --update against the local stand-ins (no production or staging systems are used)
+##     python benchmarks/check_update.py
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+records = [dict(projectid='2026-0000' + str(i), name='Curie Marie', email='pi' + str(i) + '@chalmers.se') for i in range(3)]
+failures = []
+
+
+def check(label, condition):
+    print(('✓ ' if condition else '\033[91m❌\033[0m ') + label)
+    if not condition:
+        failures.append(label)
+
+
+def run(pipeline, **options):
+    # pipeline.run with its progress output hidden
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = pipeline.run(records, 'formas', dict(dict(update_cris=True, send_emails=False, workers=2, logfile=None), **options))
+    return {r['projectid']: r for r in summary['results']}
+
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix='create-dmp-check-')
+    os.chdir(work_dir)
+    servers = start_standins(work_dir, {}, {})
+    try:
+        os.environ.update(standin_env(servers))
+        os.environ['SESSION_CACHE_PATH'] = os.path.join(work_dir, 'sessions.json')
+        sys.path.insert(0, repo_dir)
+        from create_dmp import pipeline
+        dsw, cris, gdp = (servers[name][0].standin for name in ('dsw', 'cris', 'gdp'))
+
+        run(pipeline)
+        writes = (dsw.writes, cris.writes)
+        results = run(pipeline, update=True)
+        check('Unchanged grants are skipped without write calls', (dsw.writes, cris.writes) == writes and
+              all(r['status'] == 'unchanged' for r in results.values()))
+
+        # A Swedish title is only copied to CRIS, with -u n it has to stay pending for a later -u y run
+        gdp.gdp_corrections['2026-00001'] = {'titel': 'Rättad titel'}
+        results = run(pipeline, update=True, update_cris=False)
+        check('-u n leaves the CRIS project alone', results['2026-00001']['updated_fields'] == [] and
+              all(p['ProjectTitleSwe'] != 'Rättad titel' for p in cris.cris_projects.values()))
+        results = run(pipeline, update=True)
+        check('A later -u y run updates the fields left by -u n', results['2026-00001']['updated_fields'] == ['cris:title_swe'] and
+              any(p['ProjectTitleSwe'] == 'Rättad titel' for p in cris.cris_projects.values()))
+        results = run(pipeline, update=True)
+        check('...and after that the grant is unchanged', results['2026-00001']['status'] == 'unchanged')
+
+        # A mirror that has not been synced since the correction must not hide it
+        from create_dmp import gdp_mirror
+        mirror = gdp_mirror.open_mirror()
+        gdp_mirror.store_activity(mirror, 'formas', dict(diarienummer='2026-00002', titel='Projekt 2026-00002', titelEng='Project 2026-00002',
+                                                         beskrivning='Beskrivning. ' * 150, beskrivningEng='Description. ' * 150,
+                                                         startdatum='2026-01-01T00:00:00', slutdatum='2028-12-31T00:00:00'))
+        mirror.commit()
+        mirror.close()
+        gdp.gdp_corrections['2026-00002'] = {'slutdatum': '2030-06-30T00:00:00'}
+        results = run(pipeline, update=True)
+        check('A changed end date is sent to DSW and CRIS only, also with an old GDP mirror', results['2026-00002']['updated_fields'] == ['dsw:end', 'cris:end'] and
+              results['2026-00000']['status'] == 'unchanged')
+
+        # Without an index entry the CRIS project is found by search, the full record has to be read before it is saved
+        from create_dmp import dmp_index
+        index = dmp_index.open_index()
+        index.execute("DELETE FROM dmps WHERE projectid = '2026-00000'")
+        index.commit()
+        index.close()
+        gdp.gdp_corrections['2026-00000'] = {'slutdatum': '2031-12-31T00:00:00'}
+        results = run(pipeline, update=True)
+        cris_project = next(p for p in cris.cris_projects.values() if p['EndDate'].startswith('2031'))
+        check('Without an index entry the CRIS project is updated from its full record', results['2026-00000']['status'] == 'updated' and
+              cris_project.get('Persons') and cris_project.get('ProjectDescriptionEngHtml'))
+
+        # A corrected title without an index entry or DMP link in CRIS: the DMP still has its old title in DSW
+        index = dmp_index.open_index()
+        index.execute("DELETE FROM dmps WHERE projectid = '2026-00002'")
+        index.commit()
+        index.close()
+        for p in cris.cris_projects.values():
+            for contract in p['Contracts']:
+                if any(i['ProjectContractIdentifierValue'] == '2026-00002' for i in contract['ContractIdentifiers']):
+                    contract.pop('DmpValue', None)
+        gdp.gdp_corrections['2026-00002'] = {'titelEng': 'Corrected title'}
+        results = run(pipeline, update=True)
+        check('A DMP is found by its old title when the funder has corrected it', results['2026-00002']['status'] == 'updated' and
+              'dsw:title' in results['2026-00002']['updated_fields'])
+    finally:
+        stop_standins(servers)
+
+    if failures:
+        print('\033[91m❌\033[0m ' + str(len(failures)) + ' check(s) failed, stand-in files are in ' + work_dir)
+        raise SystemExit(1)
+    print('✓ All checks passed')
+
+
+if __name__ == '__main__':
+    main()
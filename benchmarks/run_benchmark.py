@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import random
+import tempfile
+import subprocess
+from datetime import datetime
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from standins import start_standins, stop_standins, standin_env
+
+## Benchmark for create-dmp against local stand-ins for DSW, CRIS, GDP, PDB and SMTP
+## Reports rows/second, p50/p99 per-project latency and peak memory per scenario, see README.md
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+backends = ['dsw', 'cris', 'gdp', 'pdb', 'smtp']
+
+first_names = ['Albert', 'Ada', 'Nikola', 'Gustaf', 'Marie', 'Lise', 'Alan', 'Grace', 'Niels', 'Emmy']
+last_names = ['Einstein', 'Lovelace', 'Tesla', 'Dahlén', 'Curie', 'Meitner', 'Turing', 'Hopper', 'Bohr', 'Noether']
+
+
+def write_infile(path, rows, seed):
+    # Deterministic input, about three grants per PI so user lookups are shared like in real batches
+    rnd = random.Random(seed)
+    pis = max(1, rows // 3)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for i in range(rows):
+            pi = rnd.randrange(pis)
+            name = last_names[pi % len(last_names)] + ' ' + first_names[(pi // len(last_names)) % len(first_names)]
+            f.write('2026-' + str(i).zfill(5) + '\t' + name + '\tpi' + str(pi) + '@chalmers.se\n')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def read_results(work_dir):
+    # Summary written by create-dmp next to its logfile, with the duration of every project
+    for filename in os.listdir(work_dir):
+        if filename.endswith('.json'):
+            with open(os.path.join(work_dir, filename), encoding='utf-8') as rf:
+                results = json.load(rf)
+            if 'results' in results:
+                return results
+    return None
+
+
+def run_scenario(rows, args, latencies, error_rates):
+    work_dir = tempfile.mkdtemp(prefix='create-dmp-bench-')
+    servers = start_standins(work_dir, latencies, error_rates, seed=args.seed)
+    try:
+        infile = os.path.join(work_dir, 'bench_' + str(rows) + '.txt')
+        write_infile(infile, rows, args.seed)
+        # create-dmp checks for create_dmp/.env in the current directory, all settings are passed in the environment
+        os.makedirs(os.path.join(work_dir, 'create_dmp'), exist_ok=True)
+        open(os.path.join(work_dir, 'create_dmp', '.env'), 'w').close()
+
+        send_emails = 'y' if servers['smtp'][0] and not args.no_emails else 'n'
+        env = dict(os.environ)
+        env.update(standin_env(servers))
+        env['SESSION_CACHE_PATH'] = os.path.join(work_dir, 'sessions.json')
+        env['PYTHONPATH'] = repo_dir + os.pathsep + env.get('PYTHONPATH', '')
+        env['CRIS_PERSONS_PATH'] = os.path.join(work_dir, 'cris_persons.db')
+        if args.cris_snapshot:
+            # Snapshot synced before the run, its requests are not counted for the run
+            with open(os.path.join(work_dir, 'sync_output.txt'), 'w') as output:
+                subprocess.run([sys.executable, '-m', 'create_dmp.main', 'sync-cris-persons'], cwd=work_dir, env=env,
+                               stdout=output, stderr=subprocess.STDOUT)
+            servers['cris'][0].standin.requests = 0
+            servers['cris'][0].standin.bytes_sent = 0
+        command = [sys.executable, '-m', 'create_dmp.main', '-i', infile, '-f', args.funder,
+                   '-u', 'y', '-e', send_emails, '-w', str(args.workers)]
+        with open(os.path.join(work_dir, 'output.txt'), 'w') as output:
+            started = datetime.now()
+            process = subprocess.Popen(command, cwd=work_dir, env=env, stdin=subprocess.PIPE,
+                                       stdout=output, stderr=subprocess.STDOUT)
+            process.stdin.write(b'Y\n')
+            process.stdin.close()
+            # wait4 gives the resource usage of this run only
+            pid, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            wall_time = (datetime.now() - started).total_seconds()
+
+        summary = read_results(work_dir) or dict(results=[], duration=0)
+        completed = sum(1 for r in summary['results'] if r['dmp_uuid'])
+        latencies_ms = [r['duration'] * 1000 for r in summary['results']]
+        result = dict(
+            rows=rows,
+            completed=completed,
+            exit_code=process.returncode,
+            send_emails=send_emails == 'y',
+            rows_per_second=round(len(summary['results']) / summary['duration'], 2) if summary['duration'] else None,
+            p50_ms=round(percentile(latencies_ms, 50), 1) if latencies_ms else None,
+            p99_ms=round(percentile(latencies_ms, 99), 1) if latencies_ms else None,
+            peak_memory_mb=round(rusage.ru_maxrss / 1024, 1),
+            wall_time_s=round(wall_time, 1),
+            requests={name: server.standin.requests for name, (server, port) in servers.items() if server},
+            injected_errors={name: server.standin.errors for name, (server, port) in servers.items() if server},
+            bytes_sent={name: server.standin.bytes_sent for name, (server, port) in servers.items() if server and name != 'smtp'},
+            work_dir=work_dir
+        )
+    finally:
+        stop_standins(servers)
+    return result
+
+
+def parse_backend_values(values, cast):
+    parsed = dict()
+    for value in values or []:
+        name, _, number = value.partition('=')
+        if name not in backends or not number:
+            raise SystemExit('Invalid backend setting ' + value + ', use one of ' + ', '.join(backends) + ' as name=value')
+        parsed[name] = cast(number)
+    return parsed
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark create-dmp against local stand-ins for DSW, CRIS, GDP, PDB and SMTP.',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-r', '--rows', help='Scenario sizes (number of input rows)', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('-f', '--funder', help='Funder name, formas or vr', choices=['formas', 'vr'], default='formas')
+    parser.add_argument('-l', '--latency', help='Latency in ms for all stand-ins', type=float, default=0)
+    parser.add_argument('--backend-latency', help='Latency in ms for one stand-in, e.g. dsw=50 (repeatable)', action='append')
+    parser.add_argument('--error-rate', help='Share of failing requests for all stand-ins', type=float, default=0.0)
+    parser.add_argument('--backend-error-rate', help='Share of failing requests for one stand-in, e.g. gdp=0.05 (repeatable)', action='append')
+    parser.add_argument('-w', '--workers', help='Passed on to create-dmp -w', type=int, default=4)
+    parser.add_argument('--cris-snapshot', action='store_true', help='Sync the CRIS person snapshot before each scenario')
+    parser.add_argument('--no-emails', action='store_true', help='Run without sending e-mails to the SMTP sink')
+    parser.add_argument('-s', '--seed', help='Seed for input data and error injection', type=int, default=1)
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file, for comparing runs')
+    args = parser.parse_args()
+
+    latencies = {name: args.latency for name in backends}
+    latencies.update(parse_backend_values(args.backend_latency, float))
+    error_rates = {name: args.error_rate for name in backends}
+    error_rates.update(parse_backend_values(args.backend_error_rate, float))
+
+    results = []
+    print('rows\tcompleted\trows/s\tp50 ms\tp99 ms\tpeak MB\twall s')
+    for rows in args.rows:
+        result = run_scenario(rows, args, latencies, error_rates)
+        results.append(result)
+        print('\t'.join(str(result[key]) for key in ['rows', 'completed', 'rows_per_second', 'p50_ms', 'p99_ms',
+                                                      'peak_memory_mb', 'wall_time_s']), flush=True)
+        if result['exit_code'] != 0 or result['completed'] < rows:
+            print('  see ' + os.path.join(result['work_dir'], 'output.txt') + ' for the create-dmp output')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(settings=dict(funder=args.funder, latency_ms=latencies, error_rate=error_rates,
+                                         workers=args.workers, seed=args.seed),
+                           results=results), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
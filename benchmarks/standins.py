@@ -0,0 +1,419 @@
+import os
+import ssl
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+import gzip
+import zlib
+import random
+import base64
+import threading
+import subprocess
+import socketserver
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+## Local stand-ins for the backends used by create-dmp (DSW, CRIS, GDP, PDB and SMTP)
+## Each stand-in answers with a configurable latency (ms) and error rate (share of requests failing)
+
+
+class StandIn:
+    # Common latency/error injection for all stand-ins, seeded so runs can be repeated
+    def __init__(self, latency=0, error_rate=0.0, seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.writes = 0
+        self.bytes_sent = 0
+
+    def delay_and_fail(self):
+        with self.lock:
+            self.requests += 1
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency / 1000)
+        return fail
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body) if body else None
+
+    def send_json(self, data, status=200, headers=None, conditional=False):
+        body = json.dumps(data).encode('utf-8')
+        headers = dict(headers or {})
+        if conditional:
+            # ETag/If-None-Match and gzip like a caching, compressing API gateway
+            etag = '"' + format(zlib.crc32(body), '08x') + '"'
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+            elif 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body)
+                headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.standin.lock:
+            self.server.standin.bytes_sent += len(body)
+
+    def handle_any(self, method):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.read_json() if method in ('POST', 'PUT') else None
+        if method != 'GET':
+            with self.server.standin.lock:
+                self.server.standin.writes += 1
+        if self.server.standin.delay_and_fail():
+            return self.send_json({'error': 'Internal server error (injected)'}, status=500)
+        self.route(method, url.path, query, body)
+
+    def do_GET(self):
+        self.handle_any('GET')
+
+    def do_POST(self):
+        self.handle_any('POST')
+
+    def do_PUT(self):
+        self.handle_any('PUT')
+
+    def do_DELETE(self):
+        self.handle_any('DELETE')
+
+    def route(self, method, path, query, body):
+        self.send_json({'error': 'Not found'}, status=404)
+
+
+class DSWHandler(StandInHandler):
+    def route(self, method, path, query, body):
+        standin = self.server.standin
+        if path.endswith('/tokens') and method == 'POST':
+            with standin.lock:
+                standin.token_count += 1
+                token = 'standin-token-' + str(standin.token_count)
+                standin.tokens.add(token)
+            return self.send_json({'token': token})
+        if self.headers.get('Authorization', '').split(' ')[-1] not in standin.tokens:
+            return self.send_json({'error': 'Unauthorized'}, status=401)
+        if path.endswith('/users') and method == 'GET':
+            with standin.lock:
+                # Substring search like DSW, so pi1@chalmers.se also finds xpi1@chalmers.se
+                users = [{'uuid': useruuid, 'email': email, 'active': useruuid in standin.active_users}
+                         for email, useruuid in standin.users.items() if query.get('q', '').lower() in email.lower()]
+            return self.send_json({'_embedded': {'users': users}, 'page': {'totalElements': len(users)}})
+        if path.endswith('/users') and method == 'POST':
+            useruuid = str(uuid.uuid4())
+            with standin.lock:
+                standin.users[body['email']] = useruuid
+            return self.send_json({'uuid': useruuid}, status=201)
+        if '/users/' in path and method == 'PUT':
+            # New users are inactive until activated
+            if body.get('active'):
+                with standin.lock:
+                    standin.active_users.add(path.rsplit('/', 1)[-1])
+            return self.send_json({'uuid': path.rsplit('/', 1)[-1], 'active': bool(body.get('active'))})
+        if path.endswith('/users/current') and method == 'GET':
+            return self.send_json({'uuid': standin.service_user})
+        if path.endswith('/projects') and method == 'GET':
+            # Newest first, like sort=createdAt,desc, q matches the project name
+            page, size = int(query.get('page', 0)), int(query.get('size', 20))
+            with standin.lock:
+                projects = sorted(standin.projects.values(), key=lambda p: p['createdAt'], reverse=True)
+            if query.get('q'):
+                projects = [p for p in projects if query['q'].lower() in (p.get('name') or '').lower()]
+            return self.send_json({'_embedded': {'projects': projects[page * size:(page + 1) * size]},
+                                   'page': {'size': size, 'number': page, 'totalElements': len(projects),
+                                            'totalPages': (len(projects) + size - 1) // size}})
+        if path.endswith('/projects') and method == 'POST':
+            dmpuuid = str(uuid.uuid4())
+            created = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            with standin.lock:
+                standin.projects[dmpuuid] = {'uuid': dmpuuid, 'name': body.get('name'), 'createdAt': created,
+                                             'permissions': [{'member': {'uuid': standin.service_user, 'type': 'UserMember'},
+                                                              'perms': ['VIEW', 'COMMENT', 'EDIT', 'ADMIN']}]}
+            return self.send_json({'uuid': dmpuuid}, status=201)
+        if path.endswith('/share') and method == 'PUT':
+            with standin.lock:
+                project = standin.projects.get(path.split('/')[-2])
+                if project is not None:
+                    project['permissions'] = [{'member': {'uuid': p['memberUuid'], 'type': 'UserMember'}, 'perms': p['perms']}
+                                              for p in body.get('permissions', [])]
+            return self.send_json({})
+        if path.endswith('/content') and method == 'PUT':
+            # Replies are kept per path, later SetReplyEvents replace earlier ones
+            with standin.lock:
+                replies = standin.replies.setdefault(path.split('/')[-2], dict())
+                for event in body.get('events', []):
+                    if event.get('type') == 'SetReplyEvent':
+                        replies[event['path']] = {'value': event['value']}
+            return self.send_json({})
+        if path.endswith('/questionnaire') and method == 'GET':
+            with standin.lock:
+                replies = standin.replies.get(path.split('/')[-2])
+            if replies is None:
+                return self.send_json({'error': 'Not found'}, status=404)
+            return self.send_json({'uuid': path.split('/')[-2], 'replies': replies})
+        if '/projects/' in path and method == 'PUT':
+            return self.send_json({})
+        if '/projects/' in path and method == 'DELETE':
+            with standin.lock:
+                standin.projects.pop(path.rsplit('/', 1)[-1], None)
+            return self.send_json({}, status=204)
+        return super().route(method, path, query, body)
+
+
+# Persons listed by the CRIS stand-in directory (pi0@chalmers.se ... as in the benchmark input files)
+cris_directory_size = 4000
+
+
+class CRISHandler(StandInHandler):
+    def route(self, method, path, query, body):
+        if path.endswith('/ProjectSearch'):
+            # Quoted terms joined with AND/OR, a project matches if it has one of the terms as project id
+            terms = set(t for t in query.get('query', '').split('"')[1::2])
+            with self.server.standin.lock:
+                projects = [p for p in self.server.standin.cris_projects.values()
+                            if terms & {i['ProjectContractIdentifierValue'] for c in p['Contracts'] for i in c['ContractIdentifiers']}]
+            if ' AND ' in query.get('query', '') or '+AND+' in query.get('query', ''):
+                projects = [p for p in projects if all(t in json.dumps(p) for t in terms)]
+            # Hits are summaries, not the full record (no persons or HTML descriptions)
+            projects = [{key: value for key, value in p.items() if key not in ('Persons', 'ProjectDescriptionEngHtml', 'ProjectDescriptionSweHtml')}
+                        for p in projects]
+            return self.send_json({'TotalCount': len(projects), 'Projects': projects})
+        if path.endswith('/OrganizationHomes'):
+            return self.send_json({'OrganizationId': 1234})
+        if path.endswith('/Persons') and not query.get('idValue'):
+            # Person directory, paged with skip/max (at most 200 per page, whatever max asks for): pi0@chalmers.se ... with the same ids as the lookups below
+            skip, count = int(query.get('skip', 0)), min(int(query.get('max', 100)), 200)
+            persons = [{'Id': zlib.crc32(('pi' + str(n) + '@chalmers.se').encode('utf-8')) % 1000000,
+                        'Identifiers': [{'Type': {'Value': 'EMAIL'}, 'Value': 'pi' + str(n) + '@chalmers.se', 'IsActive': True}]}
+                       for n in range(skip, min(skip + count, cris_directory_size))]
+            return self.send_json({'TotalCount': cris_directory_size, 'Persons': persons})
+        if path.endswith('/Persons'):
+            person_id = zlib.crc32(query.get('idValue', '').encode('utf-8')) % 1000000
+            return self.send_json({'TotalCount': 1, 'Persons': [{'Id': person_id}]})
+        if '/Projects/' in path and method in ('GET', 'PUT'):
+            project_id = int(path.rsplit('/', 1)[-1])
+            with self.server.standin.lock:
+                if method == 'PUT' and project_id in self.server.standin.cris_projects:
+                    self.server.standin.cris_projects[project_id] = dict(body, ID=project_id)
+                cris_project = self.server.standin.cris_projects.get(project_id)
+            if cris_project is None:
+                return self.send_json({'error': 'Not found'}, status=404)
+            return self.send_json(cris_project)
+        if path.endswith('/Projects') and method == 'POST':
+            with self.server.standin.lock:
+                self.server.standin.project_count += 1
+                project_id = self.server.standin.project_count
+                self.server.standin.cris_projects[project_id] = dict(body, ID=project_id)
+            return self.send_json({'ID': project_id})
+        return super().route(method, path, query, body)
+
+
+class GDPHandler(StandInHandler):
+    def route(self, method, path, query, body):
+        projectid = query.get('diarienummer')
+        if not projectid:
+            return self.send_json([], headers={'x-totalrecords': '0'})
+        # Descriptions are a realistic size, they make up most of the GDP payload
+        activity = dict(diarienummer=projectid, titel='Projekt ' + projectid, titelEng='Project ' + projectid,
+                        beskrivning='Beskrivning. ' * 150, beskrivningEng='Description. ' * 150,
+                        startdatum='2026-01-01T00:00:00', slutdatum='2028-12-31T00:00:00')
+        # Corrections made in GDP after the DMP was created, e.g. {'2026-00001': {'slutdatum': ...}}
+        activity.update(self.server.standin.gdp_corrections.get(projectid, {}))
+        return self.send_json([activity], headers={'x-totalrecords': '1'}, conditional=True)
+
+
+class PDBHandler(StandInHandler):
+    def route(self, method, path, query, body):
+        standin = self.server.standin
+        function = body.get('function') if body else None
+        if function == 'session_start':
+            session = str(uuid.uuid4())
+            with standin.lock:
+                standin.sessions.add(session)
+            return self.send_json({'session': session})
+        if body and body.get('session') not in standin.sessions:
+            return self.send_json({'error': 'Invalid session'})
+        if function == 'session_stop':
+            with standin.lock:
+                standin.sessions.discard(body.get('session'))
+        if function == 'person_dig':
+            email = body['params'][0]['official_emails']
+            return self.send_json({'result': [{'primary_email': email, 'orcid': '0000-0002-1825-0097'}]})
+        return self.send_json({'result': True})
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    # Minimal SMTP server: accepts STARTTLS, any AUTH and discards the messages
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+        self.wfile.flush()
+
+    def handle(self):
+        standin = self.server.standin
+        tls = False
+        self.reply('220 localhost create-dmp SMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                if not tls and standin.ssl_context:
+                    self.reply('250-localhost')
+                    self.reply('250-STARTTLS')
+                    self.reply('250 AUTH PLAIN LOGIN')
+                else:
+                    self.reply('250-localhost')
+                    self.reply('250 AUTH PLAIN LOGIN')
+            elif verb == 'STARTTLS' and standin.ssl_context:
+                self.reply('220 Ready to start TLS')
+                self.request = standin.ssl_context.wrap_socket(self.request, server_side=True)
+                self.rfile = self.request.makefile('rb')
+                self.wfile = self.request.makefile('wb')
+                tls = True
+            elif verb == 'AUTH':
+                if command.upper().startswith('AUTH LOGIN'):
+                    self.reply('334 ' + base64.b64encode(b'Username:').decode('ascii'))
+                    self.rfile.readline()
+                    self.reply('334 ' + base64.b64encode(b'Password:').decode('ascii'))
+                    self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                if standin.delay_and_fail():
+                    self.reply('451 Requested action aborted (injected)')
+                else:
+                    with standin.lock:
+                        standin.messages += 1
+                    self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_ssl_context(work_dir):
+    # Self-signed certificate for STARTTLS, smtplib does not verify it by default
+    cert_path = os.path.join(work_dir, 'smtp-sink.pem')
+    try:
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=localhost', '-keyout', cert_path, '-out', cert_path],
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path)
+    return context
+
+
+http_handlers = {
+    'dsw': DSWHandler,
+    'cris': CRISHandler,
+    'gdp': GDPHandler,
+    'pdb': PDBHandler
+}
+
+
+def start_standins(work_dir, latencies, error_rates, seed=1):
+    """
+    Starts one stand-in server per backend on free local ports.
+    latencies and error_rates map backend name (dsw, cris, gdp, pdb, smtp) to ms and share of failing requests.
+    Returns backend name -> (server, port), the SMTP sink is None if no TLS certificate could be made.
+    """
+    servers = dict()
+    for offset, (name, handler) in enumerate(http_handlers.items()):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        server.standin = StandIn(latencies.get(name, 0), error_rates.get(name, 0.0), seed + offset)
+        server.standin.users = dict()
+        server.standin.active_users = set()
+        server.standin.projects = dict()
+        server.standin.project_count = 0
+        server.standin.cris_projects = dict()
+        server.standin.replies = dict()
+        server.standin.gdp_corrections = dict()
+        server.standin.service_user = str(uuid.uuid4())
+        server.standin.tokens = set()
+        server.standin.token_count = 0
+        server.standin.sessions = set()
+        servers[name] = server
+
+    ssl_context = make_ssl_context(work_dir)
+    if ssl_context:
+        smtp_server = ThreadingSMTPServer(('127.0.0.1', 0), SMTPSinkHandler)
+        smtp_server.standin = StandIn(latencies.get('smtp', 0), error_rates.get('smtp', 0.0), seed + len(servers))
+        smtp_server.standin.ssl_context = ssl_context
+        smtp_server.standin.messages = 0
+        servers['smtp'] = smtp_server
+    else:
+        servers['smtp'] = None
+
+    for server in servers.values():
+        if server:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+    return {name: (server, server.server_address[1] if server else None) for name, server in servers.items()}
+
+
+def stop_standins(servers):
+    for server, port in servers.values():
+        if server:
+            server.shutdown()
+            server.server_close()
+
+
+def standin_env(servers):
+    # Environment for create-dmp pointing all backends at the stand-ins
+    base = 'http://127.0.0.1:'
+    env = dict(
+        DSW_URL=base + str(servers['dsw'][1]) + '/wizard-api',
+        DSW_UI_URL='http://dsw.standin/wizard',
+        DSW_USER='benchmark@chalmers.se', DSW_PW='benchmark',
+        PACKAGE_ID='chalmers:root:0.0.0', TEMPLATE_ID='chalmers:standin:0.0.0',
+        CRIS_URL='http://research.standin',
+        CRIS_API_URL=base + str(servers['cris'][1]) + '/api',
+        CRIS_PERSON_URL=base + str(servers['cris'][1]) + '/api',
+        CRIS_YEAR='2026',
+        PDB_API_URL=base + str(servers['pdb'][1]) + '/pdb',
+        PDB_USER='benchmark', PDB_PW='benchmark',
+        GDP_URL_FORMAS=base + str(servers['gdp'][1]) + '/gdp_formas/finansieradeaktiviteter',
+        GDP_URL_VR=base + str(servers['gdp'][1]) + '/gdp_vr/finansieradeaktiviteter',
+        GDP_API_KEY_FORMAS='benchmark', GDP_API_KEY_VR='benchmark',
+        GDP_MIRROR_PATH='no-gdp-mirror.db',
+        EMAIL_SENDER='dataoffice@chalmers.se'
+    )
+    if servers['smtp'][0]:
+        env.update(SMTP_SERVER='127.0.0.1', SMTP_PORT=str(servers['smtp'][1]),
+                   SMTP_USER='benchmark', SMPT_PASSWORD='benchmark')
+    return env
@@ -1,10 +1,15 @@
-import os
-from dotenv import load_dotenv
+# Importing the package has no side effects, settings (.env) are loaded when the pipeline or the CLI is first used
+# Use as: from create_dmp import run, or from create_dmp import pipeline
 
-# Load .env file from the package directory
-env_path = os.path.join(os.path.dirname(__file__), '.env')
-if os.path.exists(env_path):
-    load_dotenv(dotenv_path=env_path)
 
-# Optional: expose main function
-from .main import main
+def __getattr__(name):
+    if name == 'run':
+        from .pipeline import run
+        globals()['run'] = run
+        return run
+    if name == 'main':
+        # Importing the main module sets create_dmp.main to the module, replace it with the function
+        from .main import main
+        globals()['main'] = main
+        return main
+    raise AttributeError("module 'create_dmp' has no attribute " + repr(name))
@@ -0,0 +1,161 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import requests
+from . import utils
+from . import dsw
+from . import sessions
+
+## Post-run audit: checks that the DMPs and CRIS projects of a run (results .json from create-dmp or merge) are in place
+## DSW is read with the paged project listing and CRIS with batched ProjectSearch queries, not one GET per project
+##     create-dmp audit formas_20251030_121212.json
+
+# Owner permissions set by the pipeline when sharing a DMP
+owner_perms = {'VIEW', 'COMMENT', 'EDIT', 'ADMIN'}
+
+
+def run_window_start(summary, margin_minutes=5):
+    # Run start as UTC timestamp comparable with DSW createdAt, a bit earlier to allow for clock differences
+    started = datetime.fromisoformat(summary['started']).astimezone(timezone.utc)
+    return (started - timedelta(minutes=margin_minutes)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def run_window_end(summary, margin_minutes=1):
+    # Run end as UTC timestamp, a bit later to allow for clock differences, DMPs of later runs are not orphans of this one
+    finished = datetime.fromisoformat(summary['finished']).astimezone(timezone.utc)
+    return (finished + timedelta(minutes=margin_minutes)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def search_cris_projects(project_ids):
+    # One ProjectSearch for a batch of project ids ("id1" OR "id2" ...), returns the projects found
+    query = ' OR '.join('"' + projectid + '"' for projectid in project_ids)
+    search_response = utils.http_request('cris', 'GET', os.getenv("CRIS_API_URL") + '/ProjectSearch', hedge=True,
+                                         headers={'Accept': 'application/json'},
+                                         params={'query': query, 'max': str(len(project_ids) * 5)})
+    search_response.raise_for_status()
+    return search_response.json().get('Projects') or []
+
+
+def cris_dmp_links(cris_project):
+    # DMP links (DmpValue) in the contracts of a CRIS project
+    return {contract['DmpValue'] for contract in cris_project.get('Contracts') or [] if contract.get('DmpValue')}
+
+
+def audit(summary, session, dswurl, service_user_uuid=None, batch_size=25, workers=4, all_pages=False):
+    """
+    Verifies the results of a run against DSW and CRIS.
+    Returns a report dict with lists of findings: missing_dmps, wrong_owners, missing_cris_projects,
+    unlinked_cris_projects and orphaned_dmps (DSW projects from the run period that are not in the results).
+    """
+    results = [r for r in summary['results'] if r.get('dmp_uuid')]
+    report = dict(checked_dmps=len(results), checked_cris_projects=0, missing_dmps=[], wrong_owners=[],
+                  missing_cris_projects=[], unlinked_cris_projects=[], orphaned_dmps=[])
+
+    # DSW: all projects created since the run started, newest first
+    created_after = run_window_start(summary)
+    listed = {project['uuid']: project for project in dsw.list_projects(session, dswurl, None if all_pages else created_after)}
+    report['listed_dsw_projects'] = len(listed)
+
+    for r in results:
+        project = listed.get(r['dmp_uuid'])
+        if project is None:
+            report['missing_dmps'].append(dict(projectid=r['projectid'], dmp_uuid=r['dmp_uuid']))
+            continue
+        perms = set(dsw.project_permissions(project).get(r['owner_uuid']) or [])
+        if not owner_perms <= perms:
+            report['wrong_owners'].append(dict(projectid=r['projectid'], dmp_uuid=r['dmp_uuid'], owner_email=r['owner_email'],
+                                               owner_uuid=r['owner_uuid'], owner_perms=sorted(perms),
+                                               members=list(dsw.project_permissions(project))))
+
+    # Orphans: DMPs from the run period for the same owners/titles (or left with the service account) that are not in the results
+    created_before = run_window_end(summary)
+    known = {r['dmp_uuid'] for r in results}
+    titles = {r['title'] for r in summary['results'] if r.get('title')}
+    owners = {r['owner_uuid'] for r in summary['results'] if r.get('owner_uuid')}
+    if service_user_uuid:
+        owners.add(service_user_uuid)
+    for uuid, project in listed.items():
+        if uuid in known or not created_after <= (project.get('createdAt') or '') <= created_before:
+            continue
+        if project.get('name') in titles or owners & set(dsw.project_permissions(project)):
+            report['orphaned_dmps'].append(dict(dmp_uuid=uuid, name=project.get('name'), created=project.get('createdAt'),
+                                                members=list(dsw.project_permissions(project))))
+
+    # CRIS: batched searches for all projects that got a CRIS record in the run
+    cris_results = [r for r in results if r.get('cris_project_id')]
+    report['checked_cris_projects'] = len(cris_results)
+    batches = [cris_results[i:i + batch_size] for i in range(0, len(cris_results), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        found = executor.map(lambda batch: search_cris_projects([r['projectid'] for r in batch]), batches)
+        for batch, cris_projects in zip(batches, found):
+            by_id = {str(p.get('ID') or p.get('Id')): p for p in cris_projects}
+            for r in batch:
+                cris_project = by_id.get(str(r['cris_project_id']))
+                if cris_project is None:
+                    report['missing_cris_projects'].append(dict(projectid=r['projectid'], cris_project_id=r['cris_project_id']))
+                    continue
+                dmp_values = cris_dmp_links(cris_project)
+                if r['dmp_url'] not in dmp_values:
+                    report['unlinked_cris_projects'].append(dict(projectid=r['projectid'], cris_project_id=r['cris_project_id'],
+                                                                 dmp_url=r['dmp_url'], dmp_values=sorted(dmp_values)))
+    return report
+
+
+def print_findings(title, findings, describe):
+    if not findings:
+        print('✓ ' + title + ': none')
+        return
+    print('\033[91m!!!\033[0m ' + title + ': ' + str(len(findings)))
+    for finding in findings:
+        print('    ' + describe(finding))
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog='create-dmp audit',
+                            description='Verify the DMPs and CRIS projects of a run in bulk: missing DMPs, wrong owners, unlinked CRIS projects and orphaned DMPs.',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('results', help='Results file (.json) written by create-dmp or create-dmp merge')
+    parser.add_argument('-b', '--batch-size', help='Project ids per CRIS search', type=int, default=25)
+    parser.add_argument('-w', '--workers', help='Concurrent CRIS searches', type=int, default=4)
+    parser.add_argument('--all', action='store_true', help='Read the whole DSW project listing, not only projects created since the run started')
+    args = parser.parse_args(argv)
+
+    with open(args.results, encoding='utf-8') as rf:
+        summary = json.load(rf)
+    if summary.get('update'):
+        # Update runs create nothing and do not resolve owners, there is nothing in the run window to check
+        print('\033[91m❌\033[0m ERROR: ' + args.results + ' is from an update run (--update), audit checks the results of runs that create DMPs, exiting!')
+        raise SystemExit(1)
+    dswurl = os.getenv("DSW_URL")
+    try:
+        session = sessions.dsw_session()
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        print('\033[91m❌\033[0m ERROR: Could not authenticate with DSW, user: ' + str(os.getenv("DSW_USER")) + ', exiting!')
+        raise SystemExit(1)
+    started = datetime.now()
+    try:
+        current_user = utils.http_request('dsw', 'GET', dswurl + '/users/current', session=session)
+        service_user_uuid = current_user.json().get('uuid') if current_user.ok else None
+        report = audit(summary, session, dswurl, service_user_uuid, args.batch_size, args.workers, args.all)
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print('\033[91m❌\033[0m ERROR: Audit failed: ' + str(e))
+        raise SystemExit(1)
+    finally:
+        session.close()
+
+    print('Audited ' + str(report['checked_dmps']) + ' DMP(s) against ' + str(report['listed_dsw_projects']) + ' listed DSW project(s) and ' +
+          str(report['checked_cris_projects']) + ' CRIS project(s) in ' + str(round((datetime.now() - started).total_seconds(), 1)) + ' s\n')
+    print_findings('Missing DMPs', report['missing_dmps'], lambda f: f['projectid'] + ': DMP ' + f['dmp_uuid'] + ' not found in DSW')
+    print_findings('Wrong owners', report['wrong_owners'], lambda f: f['projectid'] + ': DMP ' + f['dmp_uuid'] + ' is not shared with ' + f['owner_email'] + ' (' + str(f['owner_uuid']) + ')')
+    print_findings('Missing CRIS projects', report['missing_cris_projects'], lambda f: f['projectid'] + ': CRIS project ' + str(f['cris_project_id']) + ' not found')
+    print_findings('Unlinked CRIS projects', report['unlinked_cris_projects'], lambda f: f['projectid'] + ': CRIS project ' + str(f['cris_project_id']) + ' does not link to ' + f['dmp_url'])
+    print_findings('Orphaned DMPs', report['orphaned_dmps'], lambda f: str(f['name']) + ': DMP ' + f['dmp_uuid'] + ' (created ' + str(f['created']) + ') is not in the results')
+
+    report_file = args.results[:-len('.json')] + '_audit.json'
+    with open(report_file, 'w', encoding='utf-8') as af:
+        json.dump(report, af, ensure_ascii=False, indent=2)
+    print('\nReport written to ' + report_file)
+    if any(report[key] for key in ['missing_dmps', 'wrong_owners', 'missing_cris_projects', 'unlinked_cris_projects', 'orphaned_dmps']):
+        raise SystemExit(1)
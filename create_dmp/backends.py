@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+import configparser
+import requests
+import urllib3
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+## Timeout budgets, circuit breakers and hedged requests for the backends (dsw, cris, gdp, pdb, swecris, smtp)
+## Settings are read from the [Backends] section in create-new-dmp.conf, used by utils.http_request()
+
+config = configparser.ConfigParser()
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create-new-dmp.conf')
+with open(config_path) as f:
+    config.read_file(f)
+
+_breakers = dict()
+_lock = threading.Lock()
+_hedge_pool = None
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    # Raised instead of calling a backend that has failed repeatedly, caught like any other connection error
+    def __init__(self, backend):
+        super().__init__('Circuit breaker for ' + backend + ' is open, backend is unavailable')
+        self.backend = backend
+
+
+def setting(backend, name, fallback):
+    # Backend specific setting (e.g. gdp.timeout), or the common one (timeout) if not set
+    return config.get('Backends', backend + '.' + name, fallback=config.get('Backends', name, fallback=fallback))
+
+
+def timeout(backend):
+    # (connect, read) timeout in seconds for a call
+    values = [float(v) for v in setting(backend, 'timeout', '5, 30').split(',')]
+    return values[0] if len(values) == 1 else (values[0], values[1])
+
+
+def hedge_delay(backend):
+    # Seconds to wait before sending a duplicate of an idempotent lookup, 0 = no hedging
+    return float(setting(backend, 'hedge', '0'))
+
+
+def _breaker(backend):
+    if backend not in _breakers:
+        _breakers[backend] = dict(state='closed', failures=0, opened_at=None, times_opened=0, rejected=0,
+                                  threshold=int(setting(backend, 'failures', '5')),
+                                  cooldown=float(setting(backend, 'cooldown', '60')))
+    return _breakers[backend]
+
+
+def reset():
+    # Close all breakers, done at the start of every pipeline run
+    with _lock:
+        _breakers.clear()
+
+
+def is_open(backend):
+    # True if calls to the backend are currently rejected, does not use up the trial call of a half-open breaker
+    with _lock:
+        breaker = _breaker(backend)
+        return breaker['state'] == 'half-open' or (breaker['state'] == 'open' and time.monotonic() - breaker['opened_at'] < breaker['cooldown'])
+
+
+def before_call(backend):
+    """
+    Raises CircuitOpenError if the breaker for the backend is open.
+    After the cooldown one trial call is let through, its outcome closes or re-opens the breaker.
+    """
+    with _lock:
+        breaker = _breaker(backend)
+        if breaker['state'] == 'open' and time.monotonic() - breaker['opened_at'] >= breaker['cooldown']:
+            breaker['state'] = 'half-open'
+            return
+        if breaker['state'] != 'closed':
+            breaker['rejected'] += 1
+            raise CircuitOpenError(backend)
+
+
+def record_success(backend):
+    with _lock:
+        breaker = _breaker(backend)
+        breaker['failures'] = 0
+        if breaker['state'] != 'closed':
+            breaker['state'] = 'closed'
+            print('✓ ' + backend + ' is responding again, circuit breaker closed.')
+
+
+def record_failure(backend):
+    with _lock:
+        breaker = _breaker(backend)
+        breaker['failures'] += 1
+        if breaker['state'] == 'half-open' or (breaker['state'] == 'closed' and breaker['failures'] >= breaker['threshold']):
+            breaker['state'] = 'open'
+            breaker['opened_at'] = time.monotonic()
+            breaker['times_opened'] += 1
+            print('\033[91m!!!\033[0m ' + backend + ' failed ' + str(breaker['failures']) + ' time(s) in a row, circuit breaker opened. Calls to ' + backend + ' fail immediately for the next ' + str(int(breaker['cooldown'])) + ' seconds.')
+
+
+def status():
+    # Breaker state per backend that has been called, for the run summary
+    with _lock:
+        return {backend: dict(state=b['state'], times_opened=b['times_opened'], rejected_calls=b['rejected'])
+                for backend, b in _breakers.items()}
+
+
+def is_failure(response=None, error=None):
+    # Timeouts, connection errors and 5xx count towards opening the breaker, 4xx are answers from a working backend
+    if error is not None:
+        return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+    return response.status_code >= 500
+
+
+def is_unavailable(error):
+    # A request exception caused by the backend (timeout, connection error, 5xx), not by the data: the call can be made again later
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return is_failure(response=error.response)
+    return is_failure(error=error)
+
+
+def never_sent(error):
+    # True if a failed request provably did not reach the backend (open breaker, connect timeout, connection refused),
+    # only then can a call that creates something be sent again without the risk of doing it twice
+    if isinstance(error, (CircuitOpenError, requests.exceptions.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', None), urllib3.exceptions.NewConnectionError)
+    return False
+
+
+def hedged(backend, send):
+    """
+    Calls send() and, if no answer has arrived after the hedge delay, sends a duplicate.
+    The first successful answer is returned, the slower call is left to finish in the background.
+    Only for idempotent lookups.
+    """
+    global _hedge_pool
+    delay = hedge_delay(backend)
+    if not delay:
+        return send(), False
+    with _lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+    started = threading.Event()
+
+    def timed_send():
+        started.set()
+        return send()
+
+    first = _hedge_pool.submit(timed_send)
+    # The delay counts from when the call is actually sent, a call waiting for a free pool thread is not slow
+    started.wait()
+    try:
+        return first.result(timeout=delay), False
+    except FutureTimeoutError:
+        pass
+    pending = {first, _hedge_pool.submit(send)}
+    response = None
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+            elif future.result().status_code < 500:
+                return future.result(), True
+            else:
+                response = future.result()
+    if response is not None:
+        return response, True
+    raise error
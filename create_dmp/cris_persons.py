@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import configparser
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import requests
+from dotenv import load_dotenv
+from . import utils
+
+## Local snapshot of the Chalmers person directory in CRIS (person id, e-mail aliases, ORCID, current organization home)
+## Kept up to date with `create-dmp sync-cris-persons`, used by the pipeline before falling back to live CRIS lookups
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+env_path = os.path.join(base_dir, '.env')
+load_dotenv(dotenv_path=env_path)
+
+# Read CRIS paging settings from config
+config = configparser.ConfigParser()
+config_path = os.path.join(base_dir, 'create-new-dmp.conf')
+with open(config_path) as f:
+    config.read_file(f)
+
+
+def default_snapshot_path():
+    return os.getenv("CRIS_PERSONS_PATH") or 'cris_persons.db'
+
+
+def open_snapshot(path=None):
+    db = sqlite3.connect(path or default_snapshot_path())
+    db.execute('CREATE TABLE IF NOT EXISTS persons (person_id TEXT PRIMARY KEY, orcid TEXT, synced TEXT) WITHOUT ROWID')
+    # E-mail aliases and ORCID of every person, lower case, this is what runs look PIs up by
+    db.execute('CREATE TABLE IF NOT EXISTS person_ids (id_type TEXT NOT NULL, id_value TEXT NOT NULL, '
+               'person_id TEXT NOT NULL, PRIMARY KEY (id_type, id_value)) WITHOUT ROWID')
+    db.execute('CREATE INDEX IF NOT EXISTS person_ids_person ON person_ids (person_id)')
+    db.execute('CREATE TABLE IF NOT EXISTS org_homes (person_id TEXT NOT NULL, year TEXT NOT NULL, '
+               'organization_id TEXT NOT NULL, PRIMARY KEY (person_id, year)) WITHOUT ROWID')
+    db.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    return db
+
+
+def open_existing_snapshot(path=None):
+    # Returns None if no snapshot has been synced yet, normal runs should not create one
+    path = path or default_snapshot_path()
+    if not os.path.exists(path):
+        return None
+    return open_snapshot(path)
+
+
+def person_identifiers(person):
+    """
+    (type, value) pairs of a CRIS person, e.g. ('EMAIL', 'name@chalmers.se') and ('ORCID', '0000-...').
+    Identifiers come as a list of {Type: {Value: 'EMAIL'}, Value: ...} (IdentifierType/IdValue in older versions).
+    """
+    pairs = []
+    for identifier in person.get('Identifiers') or []:
+        id_type = (identifier.get('Type') or {}).get('Value') or identifier.get('IdentifierType')
+        id_value = identifier.get('Value') or identifier.get('IdValue')
+        if id_type and id_value and identifier.get('IsActive', True):
+            pairs.append((id_type.upper(), str(id_value).strip().lower()))
+    return pairs
+
+
+def store_person(db, person, synced=None):
+    person_id = str(person.get('Id') or person.get('ID'))
+    pairs = person_identifiers(person)
+    orcid = next((value for id_type, value in pairs if id_type == 'ORCID'), None)
+    db.execute('INSERT OR REPLACE INTO persons (person_id, orcid, synced) VALUES (?, ?, ?)', (person_id, orcid, synced))
+    db.execute('DELETE FROM person_ids WHERE person_id = ?', (person_id,))
+    for id_type, id_value in pairs:
+        if id_type in ('EMAIL', 'ORCID'):
+            db.execute('INSERT OR REPLACE INTO person_ids (id_type, id_value, person_id) VALUES (?, ?, ?)',
+                       (id_type, id_value, person_id))
+    return person_id
+
+
+def store_person_id(db, id_type, id_value, person_id):
+    # Write-through from a live lookup
+    db.execute('INSERT OR IGNORE INTO persons (person_id) VALUES (?)', (person_id,))
+    db.execute('INSERT OR REPLACE INTO person_ids (id_type, id_value, person_id) VALUES (?, ?, ?)',
+               (id_type.upper(), id_value.strip().lower(), person_id))
+
+
+def store_org_home(db, person_id, year, organization_id):
+    db.execute('INSERT OR REPLACE INTO org_homes (person_id, year, organization_id) VALUES (?, ?, ?)',
+               (person_id, str(year), str(organization_id)))
+
+
+def find_person(db, id_value, id_type='EMAIL'):
+    row = db.execute('SELECT person_id FROM person_ids WHERE id_type = ? AND id_value = ?',
+                     (id_type.upper(), id_value.strip().lower())).fetchone()
+    return row[0] if row else None
+
+
+def get_org_home(db, person_id, year):
+    row = db.execute('SELECT organization_id FROM org_homes WHERE person_id = ? AND year = ?',
+                     (person_id, str(year))).fetchone()
+    return row[0] if row else None
+
+
+def get_last_sync(db):
+    row = db.execute("SELECT value FROM sync_state WHERE key = 'last_sync'").fetchone()
+    return row[0] if row else None
+
+
+def fetch_org_home(person_id, year):
+    # Current organization home (department level) of a person in CRIS
+    person_org_get_url = os.getenv("CRIS_PERSON_URL") + '/Persons/' + person_id + '/OrganizationHomes?year=' + str(year) + '&currentOnly=true&maxLevelDepartment=true'
+    person_org_response = utils.http_request('cris', 'GET', person_org_get_url, hedge=True, headers={'Accept': 'application/json'})
+    person_org_response.raise_for_status()
+    return person_org_response.json()['OrganizationId']
+
+
+def sync(db, year, refresh_orgs=False, workers=8, verbose=False):
+    """
+    Pages all persons from CRIS_PERSON_URL into the snapshot and fetches organization homes for the year.
+    Persons no longer in CRIS are removed (only if all TotalCount persons were returned). Organization homes already in the snapshot for the year are kept,
+    unless refresh_orgs is set.
+    Returns (persons stored, organization homes fetched, organization home lookups failed).
+    """
+    page_size = config.getint('CRIS', 'persons.pagesize')
+    params = {config.get('CRIS', 'persons.max.param'): page_size}
+    sync_started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    # Page until TotalCount persons are stored or a page is empty, CRIS may return fewer persons per page than asked for
+    stored = 0
+    total_count = None
+    while True:
+        params[config.get('CRIS', 'persons.skip.param')] = stored
+        persons_response = utils.http_request('cris', 'GET', os.getenv("CRIS_PERSON_URL") + '/Persons',
+                                              headers={'Accept': 'application/json'}, params=params)
+        persons_response.raise_for_status()
+        listing = persons_response.json()
+        persons = listing.get('Persons') or []
+        for person in persons:
+            store_person(db, person, sync_started)
+        stored += len(persons)
+        total_count = listing.get('TotalCount')
+        if verbose:
+            print(str(stored) + ' of ' + str(total_count) + ' persons')
+        if not persons or (total_count is not None and stored >= int(total_count)):
+            break
+
+    complete = total_count is None or stored >= int(total_count)
+    if complete:
+        # Persons not in this sync have left (or were removed from) CRIS
+        db.execute('DELETE FROM person_ids WHERE person_id IN (SELECT person_id FROM persons WHERE synced IS NULL OR synced != ?)', (sync_started,))
+        db.execute('DELETE FROM org_homes WHERE person_id IN (SELECT person_id FROM persons WHERE synced IS NULL OR synced != ?)', (sync_started,))
+        db.execute('DELETE FROM persons WHERE synced IS NULL OR synced != ?', (sync_started,))
+    else:
+        # Persons that were not returned may still be in CRIS, so none are removed
+        print('\033[91m!!!\033[0m Only ' + str(stored) + ' of ' + str(total_count) + ' CRIS persons were returned, no persons removed from the snapshot.')
+
+    if refresh_orgs:
+        missing = [row[0] for row in db.execute('SELECT person_id FROM persons')]
+    else:
+        missing = [row[0] for row in db.execute('SELECT person_id FROM persons WHERE person_id NOT IN '
+                                                '(SELECT person_id FROM org_homes WHERE year = ?)', (str(year),))]
+    # One OrganizationHomes call per person, run concurrently, the snapshot is written from this thread only
+    fetched = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {person_id: executor.submit(fetch_org_home, person_id, year) for person_id in missing}
+        for person_id, future in futures.items():
+            try:
+                store_org_home(db, person_id, year, future.result())
+                fetched += 1
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                failed += 1
+
+    if complete:
+        db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('last_sync', ?)", (sync_started,))
+    db.commit()
+    return stored, fetched, failed
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog='create-dmp sync-cris-persons',
+                            description='Sync the local snapshot of CRIS persons (e-mail aliases, ORCID, person id and organization home for CRIS_YEAR).',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-s', '--snapshot', help='Snapshot file, defaults to CRIS_PERSONS_PATH or cris_persons.db in the current directory')
+    parser.add_argument('--refresh-orgs', action='store_true', help='Fetch the organization homes of all persons again, not only missing ones')
+    parser.add_argument('-w', '--workers', help='Concurrent organization home lookups', type=int, default=8)
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    args = parser.parse_args(argv)
+
+    year = os.getenv("CRIS_YEAR")
+    if not os.getenv("CRIS_PERSON_URL") or not year:
+        print('\033[91m❌\033[0m ERROR: CRIS_PERSON_URL and CRIS_YEAR have to be set in .env file, exiting!')
+        raise SystemExit(1)
+    db = open_snapshot(args.snapshot)
+    try:
+        stored, fetched, failed = sync(db, year, refresh_orgs=args.refresh_orgs, workers=args.workers, verbose=args.verbose)
+        print('✓ Synced ' + str(stored) + ' CRIS persons, ' + str(fetched) + ' organization home(s) for ' + year + ' fetched.')
+        if failed:
+            print('\033[91m!!!\033[0m ' + str(failed) + ' organization home lookup(s) failed, these are looked up live when needed.')
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        db.rollback()
+        print('\033[91m❌\033[0m ERROR: CRIS person sync failed, snapshot left at previous sync: ' + str(e))
+    finally:
+        db.close()
@@ -0,0 +1,75 @@
+import os
+import json
+import sqlite3
+import hashlib
+from datetime import datetime, timezone
+
+## Local index of the DMPs and CRIS projects created per grant, with content hashes of the mapped grant fields
+## Written by every run, used by `create-dmp --update` to skip grants whose metadata has not changed since the last run
+
+# Grant fields that are copied to the DMP replies and the CRIS project
+dsw_fields = ['title', 'desc', 'start', 'end', 'grant_id', 'funder']
+cris_fields = ['title', 'title_swe', 'desc', 'desc_swe', 'start', 'end']
+
+
+def default_index_path():
+    return os.getenv("DMP_INDEX_PATH") or 'dmp_index.db'
+
+
+def open_index(path=None):
+    db = sqlite3.connect(path or default_index_path())
+    db.execute('CREATE TABLE IF NOT EXISTS dmps (funder TEXT NOT NULL, projectid TEXT NOT NULL, dmp_uuid TEXT NOT NULL, '
+               'cris_project_id TEXT, field_hashes TEXT NOT NULL, content_hash TEXT NOT NULL, updated TEXT NOT NULL, '
+               'PRIMARY KEY (funder, projectid)) WITHOUT ROWID')
+    return db
+
+
+def mapped_fields(context, projectid, project):
+    # The grant metadata as it is written to DSW and CRIS (dates without time)
+    return dict(title=project['title'], title_swe=project['title_swe'], desc=project['desc'], desc_swe=project['desc_swe'],
+                start=project['start'][0:10], end=project['end'][0:10], grant_id=projectid, funder=context['funderid'])
+
+
+def value_hash(value):
+    return hashlib.sha1(str(value if value is not None else '').strip().encode('utf-8')).hexdigest()
+
+
+def field_hashes(fields):
+    return {name: value_hash(value) for name, value in fields.items()}
+
+
+def content_hash(hashes):
+    return hashlib.sha1(json.dumps(hashes, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def entry_hashes(dsw_hashes, cris_hashes):
+    # Hashes stored in the index, the DSW and CRIS copies of a field are kept apart as one can be updated without the other
+    hashes = {'dsw:' + name: dsw_hashes.get(name) for name in dsw_fields}
+    hashes.update({'cris:' + name: cris_hashes.get(name) for name in cris_fields})
+    return hashes
+
+
+def target_hashes(entry, target):
+    # Hashes of one target (dsw or cris) in an index entry, by field name
+    return {name[len(target) + 1:]: value for name, value in entry['field_hashes'].items() if name.startswith(target + ':')}
+
+
+def changed_fields(names, current_hashes, hashes):
+    # Fields in names whose hash differs from the current one (a field missing in current counts as changed)
+    return [name for name in names if current_hashes.get(name) != hashes[name]]
+
+
+def get_entry(db, funder, projectid):
+    row = db.execute('SELECT dmp_uuid, cris_project_id, field_hashes, content_hash FROM dmps WHERE funder = ? AND projectid = ?',
+                     (funder, projectid)).fetchone()
+    if row is None:
+        return None
+    return dict(dmp_uuid=row[0], cris_project_id=row[1], field_hashes=json.loads(row[2]), content_hash=row[3])
+
+
+def store_entry(db, funder, projectid, dmp_uuid, cris_project_id, hashes):
+    db.execute('INSERT OR REPLACE INTO dmps (funder, projectid, dmp_uuid, cris_project_id, field_hashes, content_hash, updated) '
+               'VALUES (?, ?, ?, ?, ?, ?, ?)',
+               (funder, projectid, dmp_uuid, str(cris_project_id) if cris_project_id else None, json.dumps(hashes, sort_keys=True),
+                content_hash(hashes), datetime.now(timezone.utc).isoformat(timespec='seconds')))
+    db.commit()
@@ -0,0 +1,188 @@
+import random
+import string
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import tracing
+from . import backends
+
+## Helpers for the DSW API (users, projects)
+
+
+class LeftoverDMPError(requests.exceptions.RequestException):
+    # A new DMP could not be filled or shared, and deleting it failed too, so it is left in DSW
+    def __init__(self, dmp_uuid, cause):
+        super().__init__('DMP ' + dmp_uuid + ' was left in DSW: ' + str(cause))
+        self.dmp_uuid = dmp_uuid
+        self.cause = cause
+
+
+class RolledBackDMPError(requests.exceptions.RequestException):
+    # A new DMP could not be filled or shared and was deleted again, nothing is left in DSW
+    def __init__(self, dmp_uuid, cause):
+        super().__init__('DMP ' + dmp_uuid + ' was deleted again: ' + str(cause))
+        self.dmp_uuid = dmp_uuid
+        self.cause = cause
+
+
+def find_user(session, dswurl, email):
+    # The DSW user (dict with uuid and active) with this e-mail, None if there is none
+    # q is a substring search (and also matches names), so only a user with exactly this e-mail counts
+    dsw_getuser = dswurl + '/users?q=' + str(email)
+    userresponse = utils.http_request('dsw', 'GET', dsw_getuser, session=session)
+    userresponse.raise_for_status()
+    users = userresponse.json()['_embedded']['users']
+    return next((user for user in users if (user.get('email') or '').strip().lower() == str(email).strip().lower()), None)
+
+
+def create_user(session, dswurl, email, fname, lname):
+    # Create new user with a random password, the user will log in through the Idp
+    newuser_url = dswurl + '/users'
+    pw = ''.join(random.choice(string.ascii_letters) for i in range(44))
+    newuser_data = dict(email=email, lastName=lname, firstName=fname, role='researcher', password=pw,
+                        affiliation='Chalmers')
+    newuser_response = utils.http_request('dsw', 'POST', newuser_url, session=session, json=newuser_data)
+    newuser_response.raise_for_status()
+    useruuid = newuser_response.json()['uuid']
+    activate_user(session, dswurl, useruuid, email, fname, lname)
+    return useruuid
+
+
+def activate_user(session, dswurl, useruuid, email, fname, lname):
+    user_activate_url = dswurl + '/users/' + useruuid
+    activate_data = dict(email=email, active=True, lastName=lname, firstName=fname, role='researcher',
+                         affiliation='Chalmers')
+    activate_response = utils.http_request('dsw', 'PUT', user_activate_url, session=session, json=activate_data)
+    activate_response.raise_for_status()
+
+
+def _provision_user(session, dswurl, email, fname, lname, parent_span):
+    with tracing.span('provision-user', parent=parent_span, email=email) as span:
+        user = find_user(session, dswurl, email)
+        span['existing'] = bool(user)
+        if user:
+            # Created by an earlier run whose activation failed, activate it now (find_user only returns
+            # a user with this exact e-mail, so this never writes to someone else's account)
+            if not user.get('active', True):
+                span['activated'] = True
+                activate_user(session, dswurl, user['uuid'], email, fname, lname)
+            return user['uuid'], False
+        return create_user(session, dswurl, email, fname, lname), True
+
+
+def provision_users(session, dswurl, users, workers=4):
+    """
+    Makes sure all users exist and are active in DSW before any DMPs are created.
+    users maps e-mail to (first name, last name). Lookups, creation and activation run
+    concurrently and a failing user does not stop the others.
+    Returns (ready, created, failed, unavailable): e-mail -> user uuid for ready users, the e-mails of
+    newly created users, e-mail -> error message for users that could not be provisioned and the
+    e-mails of those that failed because DSW did not respond (timeout, connection error, 5xx).
+    """
+    ready = dict()
+    created = []
+    failed = dict()
+    unavailable = set()
+    parent_span = tracing.current()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {email: executor.submit(_provision_user, session, dswurl, email, fname, lname, parent_span)
+                   for email, (fname, lname) in users.items()}
+        for email, future in futures.items():
+            try:
+                useruuid, is_new = future.result()
+                ready[email] = useruuid
+                if is_new:
+                    created.append(email)
+            except requests.exceptions.HTTPError as e:
+                failed[email] = str(e) + ': ' + e.response.text
+                if backends.is_unavailable(e):
+                    unavailable.add(email)
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                failed[email] = repr(e)
+                if isinstance(e, requests.exceptions.RequestException) and backends.is_unavailable(e):
+                    unavailable.add(email)
+    return ready, created, failed, unavailable
+
+
+def create_dmp_project(session, dswurl, create_data, content_data, share_data):
+    """
+    Creates a DMP, fills it with content and shares it with its owner as one operation.
+    The DSW API has no call that does all three, so the requests are sent back to back over
+    the same (keep-alive) session. Every response is checked, and if filling or sharing
+    fails the new project is deleted again so no half-created DMPs are left behind.
+    Returns the uuid of the new DMP. Raises requests.exceptions.RequestException if the project could
+    not be created (DSW may still have created it if the answer was lost, e.g. on a read timeout),
+    RolledBackDMPError if it was created and deleted again, or LeftoverDMPError if it could not be deleted.
+    """
+    create_response = utils.http_request('dsw', 'POST', dswurl + '/projects', session=session, json=create_data)
+    create_response.raise_for_status()
+    dmpuuid = create_response.json()['uuid']
+    try:
+        content_response = utils.http_request('dsw', 'PUT', dswurl + '/projects/' + dmpuuid + '/content', session=session, json=content_data)
+        content_response.raise_for_status()
+        share_response = utils.http_request('dsw', 'PUT', dswurl + '/projects/' + dmpuuid + '/share', session=session, json=share_data)
+        share_response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        try:
+            delete_response = utils.http_request('dsw', 'DELETE', dswurl + '/projects/' + dmpuuid, session=session)
+            delete_response.raise_for_status()
+        except requests.exceptions.RequestException:
+            raise LeftoverDMPError(dmpuuid, e)
+        raise RolledBackDMPError(dmpuuid, e)
+    return dmpuuid
+
+
+def list_projects(session, dswurl, created_after=None, page_size=100):
+    """
+    Pages through the DSW project listing, newest first, and yields one project dict at a time.
+    With created_after (ISO timestamp) paging stops at the first page that only has older projects.
+    """
+    page = 0
+    while True:
+        params = dict(page=page, size=page_size, sort='createdAt,desc', isTemplate='false')
+        list_response = utils.http_request('dsw', 'GET', dswurl + '/projects', session=session, params=params)
+        list_response.raise_for_status()
+        listing = list_response.json()
+        projects = listing['_embedded']['projects']
+        for project in projects:
+            yield project
+        if created_after and projects and all((p.get('createdAt') or '') < created_after for p in projects):
+            return
+        if page + 1 >= listing['page']['totalPages']:
+            return
+        page += 1
+
+
+def project_permissions(project):
+    # member uuid -> perms for a project in the listing (member.uuid in newer DSW versions, memberUuid in older)
+    return {(perm.get('member') or {}).get('uuid') or perm.get('memberUuid'): perm.get('perms', [])
+            for perm in project.get('permissions', [])}
+
+
+def find_projects(session, dswurl, query, page_size=20):
+    # Projects with query in their name (first page only)
+    params = dict(q=query, page=0, size=page_size, isTemplate='false')
+    search_response = utils.http_request('dsw', 'GET', dswurl + '/projects', session=session, params=params)
+    search_response.raise_for_status()
+    return search_response.json()['_embedded']['projects']
+
+
+def project_replies(session, dswurl, dmpuuid):
+    # Replies of a project: path -> {value: {type, value}, ...}
+    questionnaire_response = utils.http_request('dsw', 'GET', dswurl + '/projects/' + dmpuuid + '/questionnaire', session=session)
+    questionnaire_response.raise_for_status()
+    return questionnaire_response.json()['replies']
+
+
+def reply_value(replies, path):
+    # Plain value of a reply (the id for integration replies), None if the question has no reply
+    value = ((replies.get(path) or {}).get('value') or {}).get('value')
+    if isinstance(value, dict):
+        return value.get('id')
+    return value
+
+
+def update_project_content(session, dswurl, dmpuuid, events):
+    # Adds events (e.g. SetReplyEvents for changed replies) to an existing project
+    content_response = utils.http_request('dsw', 'PUT', dswurl + '/projects/' + dmpuuid + '/content', session=session, json=dict(events=events))
+    content_response.raise_for_status()
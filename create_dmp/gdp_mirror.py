@@ -0,0 +1,155 @@
+import os
+import json
+import zlib
+import sqlite3
+import configparser
+from datetime import datetime, timezone
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+import requests
+from dotenv import load_dotenv
+from . import utils
+
+## Local mirror of GDP finansieradeaktiviteter (Formas and VR) for Chalmers
+## Kept up to date with `create-dmp sync-gdp`, read by main.py before falling back to a live GDP lookup
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+env_path = os.path.join(base_dir, '.env')
+load_dotenv(dotenv_path=env_path)
+
+# GDP_URL_FORMAS/GDP_URL_VR can be set to use another GDP instance (e.g. the benchmark stand-ins)
+gdp_urls = {
+    'formas': os.getenv("GDP_URL_FORMAS") or 'https://api.formas.se/gdp_formas/finansieradeaktiviteter',
+    'vr': os.getenv("GDP_URL_VR") or 'https://api.vr.se/gdp_vr/finansieradeaktiviteter'
+}
+gdp_api_key_envs = {
+    'formas': 'GDP_API_KEY_FORMAS',
+    'vr': 'GDP_API_KEY_VR'
+}
+
+# Only the fields used when creating DMPs and CRIS projects are kept in the mirror
+gdp_fields = ['diarienummer', 'titel', 'titelEng', 'beskrivning', 'beskrivningEng', 'startdatum', 'slutdatum']
+
+# Read GDP query settings from config
+config = configparser.ConfigParser()
+config_path = os.path.join(base_dir, 'create-new-dmp.conf')
+with open(config_path) as f:
+    config.read_file(f)
+
+
+def default_mirror_path():
+    return os.getenv("GDP_MIRROR_PATH") or 'gdp_mirror.db'
+
+
+def open_mirror(path=None):
+    db = sqlite3.connect(path or default_mirror_path())
+    db.execute('CREATE TABLE IF NOT EXISTS activities (funder TEXT NOT NULL, diarienummer TEXT NOT NULL, '
+               'data BLOB NOT NULL, PRIMARY KEY (funder, diarienummer)) WITHOUT ROWID')
+    db.execute('CREATE TABLE IF NOT EXISTS sync_state (funder TEXT PRIMARY KEY, last_sync TEXT NOT NULL)')
+    return db
+
+
+def open_existing_mirror(path=None):
+    # Returns None if no mirror has been synced yet, normal runs should not create one
+    path = path or default_mirror_path()
+    if not os.path.exists(path):
+        return None
+    return open_mirror(path)
+
+
+def store_activity(db, funder_name, activity):
+    # Records are stored as compressed JSON, descriptions make up most of the size
+    record = {field: activity.get(field) for field in gdp_fields}
+    data = zlib.compress(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+    db.execute('INSERT OR REPLACE INTO activities (funder, diarienummer, data) VALUES (?, ?, ?)',
+               (funder_name, str(activity['diarienummer']).strip(), data))
+
+
+def get_activity(db, funder_name, projectid):
+    row = db.execute('SELECT data FROM activities WHERE funder = ? AND diarienummer = ?',
+                     (funder_name, projectid)).fetchone()
+    if row is None:
+        return None
+    return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+
+
+def get_last_sync(db, funder_name):
+    row = db.execute('SELECT last_sync FROM sync_state WHERE funder = ?', (funder_name,)).fetchone()
+    return row[0] if row else None
+
+
+def sync(db, funder_name, full=False, verbose=False):
+    """
+    Fetches Chalmers funded activities for a funder from GDP and upserts them into the mirror.
+    Only records changed since the last sync are requested, unless full is set.
+    Returns the number of records stored.
+    """
+    gdp_headers = {'Accept': 'application/json',
+                   'Authorization': os.getenv(gdp_api_key_envs[funder_name])}
+    page_size = config.getint('GDP', 'pagesize')
+    page = config.getint('GDP', 'page.start')
+    last_sync = None if full else get_last_sync(db, funder_name)
+    # Take the new watermark before fetching, so changes made during the sync are picked up next time
+    sync_started = datetime.now(timezone.utc)
+
+    params = {config.get('GDP', 'org.param'): config.get('GDP', 'org.value'),
+              config.get('GDP', 'pagesize.param'): page_size}
+    if last_sync:
+        last_sync_date = datetime.fromisoformat(last_sync)
+        params[config.get('GDP', 'modified.param')] = last_sync_date.strftime(config.get('GDP', 'modified.format', raw=True))
+        print('Fetching ' + funder_name + ' activities changed since ' + last_sync)
+    else:
+        print('Fetching all ' + funder_name + ' activities (full sync)')
+
+    # Page until all x-totalrecords are stored or a page is empty, GDP may return fewer records per page than asked for
+    stored = 0
+    total_records = None
+    while True:
+        params[config.get('GDP', 'page.param')] = page
+        gdpresponse = utils.http_request('gdp', 'GET', gdp_urls[funder_name], headers=gdp_headers, params=params)
+        gdpresponse.raise_for_status()
+        activities = gdpresponse.json()
+        for activity in activities:
+            store_activity(db, funder_name, activity)
+        stored += len(activities)
+        total_records = gdpresponse.headers.get("x-totalrecords")
+        if verbose:
+            print('Page ' + str(page) + ': ' + str(len(activities)) + ' records (' + str(stored) + ' of ' + str(total_records) + ')')
+        if not activities or (total_records is not None and stored >= int(total_records)):
+            break
+        page += 1
+
+    if total_records is not None and stored < int(total_records):
+        # Keep the old watermark, otherwise the records that were not fetched would never be requested again
+        print('\033[91m!!!\033[0m Only ' + str(stored) + ' of ' + total_records + ' ' + funder_name + ' activities were returned, last sync time not updated.')
+    else:
+        db.execute('INSERT OR REPLACE INTO sync_state (funder, last_sync) VALUES (?, ?)',
+                   (funder_name, sync_started.isoformat(timespec='seconds')))
+    db.commit()
+    return stored
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog='create-dmp sync-gdp',
+                            description='Sync the local mirror of GDP funded activities (Formas and VR) for Chalmers.',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-f', '--funder', help='Funder to sync, formas, vr or all', choices=['formas', 'vr', 'all'], default='all')
+    parser.add_argument('-m', '--mirror', help='Mirror file, defaults to GDP_MIRROR_PATH or gdp_mirror.db in the current directory')
+    parser.add_argument('--full', action='store_true', help='Fetch all records, not only those changed since the last sync')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    args = parser.parse_args(argv)
+
+    funders = list(gdp_urls) if args.funder == 'all' else [args.funder]
+    db = open_mirror(args.mirror)
+    try:
+        for funder_name in funders:
+            if not os.getenv(gdp_api_key_envs[funder_name]):
+                print('\033[91m❌\033[0m ERROR: ' + gdp_api_key_envs[funder_name] + ' is not set in .env file, skipping ' + funder_name + '!')
+                continue
+            try:
+                stored = sync(db, funder_name, full=args.full, verbose=args.verbose)
+                print('✓ Synced ' + str(stored) + ' ' + funder_name + ' activities from GDP.')
+            except (requests.exceptions.RequestException, ValueError) as e:
+                db.rollback()
+                print('\033[91m❌\033[0m ERROR: GDP sync for ' + funder_name + ' failed, mirror left at previous sync: ' + str(e))
+    finally:
+        db.close()
@@ -0,0 +1,78 @@
+import os
+import json
+import zlib
+import sqlite3
+import requests
+from . import utils
+
+## Local body store for project metadata lookups (GDP, SweCRIS), keyed by URL
+## Bodies are kept with their validators (ETag, Last-Modified). Re-fetches are sent as conditional requests
+## and a 304 Not Modified answer is served from the store, so re-runs of a batch only move headers over the network
+
+# Response headers that are needed when a body is served from the store
+kept_headers = ['content-type', 'x-totalrecords', 'etag', 'last-modified']
+
+# gzip/deflate always, br only if the brotli package is installed (urllib3 decodes what it announces)
+accept_encoding = requests.utils.DEFAULT_ACCEPT_ENCODING
+
+
+def default_cache_path():
+    return os.getenv("HTTP_CACHE_PATH") or 'http_cache.db'
+
+
+def open_cache(path=None):
+    db = sqlite3.connect(path or default_cache_path())
+    db.execute('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+               'headers TEXT NOT NULL, body BLOB NOT NULL, stored_at TEXT NOT NULL) WITHOUT ROWID')
+    return dict(db=db, stats=dict(requests=0, not_modified=0, bytes_received=0, bytes_saved=0))
+
+
+def close_cache(cache):
+    cache['db'].close()
+
+
+def _wire_bytes(response):
+    # Bytes as received, i.e. compressed if the server used gzip/br
+    try:
+        return response.raw.tell()
+    except AttributeError:
+        return len(response.content)
+
+
+def get(cache, backend, url, headers=None, **kwargs):
+    """
+    GET through the body store. Sends If-None-Match/If-Modified-Since for URLs in the store and serves the stored
+    body on 304. Returns a requests Response in both cases (status 200 for a stored body, from_cache set to True).
+    Only successful answers with a validator are stored, other answers are returned as they are.
+    """
+    headers = dict(headers or {}, **{'Accept-Encoding': accept_encoding})
+    row = cache['db'].execute('SELECT etag, last_modified, headers, body FROM responses WHERE url = ?', (url,)).fetchone()
+    if row:
+        if row[0]:
+            headers['If-None-Match'] = row[0]
+        if row[1]:
+            headers['If-Modified-Since'] = row[1]
+    response = utils.http_request(backend, 'GET', url, headers=headers, **kwargs)
+    cache['stats']['requests'] += 1
+    cache['stats']['bytes_received'] += _wire_bytes(response)
+    response.from_cache = False
+
+    if response.status_code == 304 and row:
+        body = zlib.decompress(row[3])
+        response.status_code = 200
+        response._content = body
+        response.headers.update(json.loads(row[2]))
+        response.from_cache = True
+        cache['stats']['not_modified'] += 1
+        cache['stats']['bytes_saved'] += len(body)
+        return response
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if response.status_code == 200 and (etag or last_modified):
+        stored_headers = {name: value for name, value in response.headers.items() if name.lower() in kept_headers}
+        cache['db'].execute('INSERT OR REPLACE INTO responses (url, etag, last_modified, headers, body, stored_at) '
+                            'VALUES (?, ?, ?, ?, ?, datetime(\'now\'))',
+                            (url, etag, last_modified, json.dumps(stored_headers), zlib.compress(response.content)))
+        cache['db'].commit()
+    return response
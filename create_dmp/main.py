@@ -1,757 +1,229 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
 import json
 import sys
-from dotenv import load_dotenv
-import csv
 from datetime import datetime
 import time
 import os
-import random
-import string
-import uuid
-import configparser
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 from . import utils
+from . import gdp_mirror
+from . import cris_persons
+from . import dmp_index
+from . import pipeline
+from . import tracing
+from . import shards
+from . import httpcache
+from . import audit
+from . import sessions
 
 ## Script for creating new DMPs in Chalmers DSW from a tab-delimited input file
-## See README.md for details
-
-# Settings
-base_dir = os.path.dirname(os.path.abspath(__file__))
-env_path = os.path.join(base_dir, '.env')
-
-# DSW < 4.22 compatibility fix
-# Set to 'IntegrationType' for DSW version < 4.22, IntegrationLegacyType otherwise (if the old type is still used in KM)
-dsw_integration_type = 'IntegrationLegacyType'
-
-# Load environment variables
-load_dotenv(dotenv_path=env_path)
-dswurl = os.getenv("DSW_URL")
-dswuser = os.getenv("DSW_USER")
-dswpw = os.getenv("DSW_PW")
-packageid = os.getenv("PACKAGE_ID")
-templateid = os.getenv("TEMPLATE_ID")
-smtp_server = os.getenv("SMTP_SERVER")
-smtp_port = os.getenv("SMTP_PORT")
-smtp_user = os.getenv("SMTP_USER")
-smtp_password = os.getenv("SMPT_PASSWORD")
-email_sender = os.getenv("EMAIL_SENDER")
-create_cris_projects = ''
-cris_funder_id = ''
-send_emails = ''
-email_template = ''
-pdb_session_token = ''
-gdp_base_url = ''
-gdp_api_key = os.getenv("GDP_API_KEY")
-
-# Read config
-config = configparser.ConfigParser()
-# Get the directory of the current script
-base_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_dir, 'create-new-dmp.conf')
-# Load the config file
-with open(config_path) as f:
-    config.read_file(f)
-
-# Command line params
-parser = ArgumentParser(description='App for creating new DMP(s) and Chalmers CRIS project records from funder grant data. \nUse as (example): create-dmp -i formas_251001.txt -f formas -u y -e y',
-                        formatter_class=ArgumentDefaultsHelpFormatter)
-parser.add_argument('-i', '--infile', help='Input file, tab-delimited, with columns: ProjectID, Name (inverted), Email', required=True)
-parser.add_argument('-f', '--funder', help='Funder name, e.g. formas or vr', required=True)
-parser.add_argument('-u', '--updateCRIS', help='Create CRIS project record', choices=['y', 'n'], default='y')
-parser.add_argument('-e', '--sendEmails', help='Send e-mail to new user', choices=['y', 'n'], default='y')
-parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
-args = parser.parse_args()
-
-infile = args.infile.strip()
-funder_name = args.funder.lower().strip()
-
-# Create logfile, example: formas_20231001_121212.log
-logfile = funder_name + '_' + datetime.now().strftime("%Y%m%d_%H%M%S") + '.log'
-
-print("\nVerifying that all looks good before continuing")
-for _ in range(4):
-    print(".", end="", flush=True)
-    time.sleep(0.1)
-    time.sleep(1)
-print("\n")
-
-print("\u2713 Python version: " + str(sys.version_info.major) + "." + str(sys.version_info.minor) + "." + str(sys.version_info.micro))
-
-# Validate env variables, input etc.
-if funder_name not in ['formas', 'vr']:
-    print('\033[91m❌\033[0m ERROR: Funder has to be one of "formas", "vr". Please correct this and try again!')
-    exit()
-if args.sendEmails.lower().strip() == 'y' and (not smtp_server or not smtp_port or not smtp_user or not smtp_password or not email_sender):
-    print('\033[91m❌\033[0m ERROR: You have selected to send e-mails, but SMTP settings are not complete in .env file. Please correct this and try again!')
-    exit()
-if os.path.exists(infile) is False or utils.validate_input_file(infile) is False:
-    print("\033[91m❌\033[0m ERROR: Input file " + infile + " does not exist, is not readable or it is not in a proper format, exiting!")
-    exit()
-else:
-    print("\u2713 Input file " + infile + " exists, is readable and looks fine.")
-if utils.validate_chalmers_emails(infile):
-    print("\u2713 All emails in infile are valid Chalmers addresses.")
-else:
-    print("\033[91m❌\033[0m ERROR: Infile contains non-Chalmers email addresses. You need to fix this before continuing, exiting now!")
-    exit()
-if os.path.exists('create_dmp/.env') is False:
-    print("\033[91m❌\033[0m ERROR: .env settings file does not exist in create_dmp/ directory, exiting!")
-    exit()
-else:
-    print("\u2713 Settings file exists in current directory.")
-if os.access('.', os.W_OK):
-    print("\u2713 Script has write access to the current directory.")
-if args.sendEmails.lower().strip() == 'y' and utils.test_smtp_connection() is False:
-    print("\033[91m❌\033[0m ERROR: Could not connect to SMTP server using existing settings in .env, exiting!")
-    exit()
-else:
-    print("\u2713 SMTP mail server connected succesfully.")
-
-if args.updateCRIS.lower().strip() == 'y':
-    create_cris_projects = 'true'
-else:
-    create_cris_projects = 'false'
-
-# Define funder specific params
-if funder_name == 'formas':
-    source = 'gdp'
-    gdp_base_url = 'https://api.formas.se/gdp_formas/finansieradeaktiviteter'
-    gdp_api_key = os.getenv("GDP_API_KEY_FORMAS")
-    email_template = 'mail_template_formas.html'
-    funderid = 'https://ror.org/03pjs1y45'
-    funder_suffix = 'Formas'
-    funder_display_name = 'Formas'
-    cris_funder_id = '7f93013d-43bd-40f0-b0eb-fe21dc95c745'
-elif funder_name == 'vr':
-    source = 'gdp'
-    gdp_base_url = 'https://api.vr.se/gdp_vr/finansieradeaktiviteter'
-    gdp_api_key = os.getenv("GDP_API_KEY_VR")
-    email_template = 'mail_template_vr.html'
-    funderid = 'https://ror.org/03yrm4c26'
-    funder_suffix = 'VR'
-    funder_display_name = 'Vetenskapsrådet / Swedish Research Council (VR)'
-    cris_funder_id = '0d84752e-ee44-485f-b889-bcbe3cf6b095'
-else:
-    source = 'swecris'
-    email_template = 'mail_template_generic.html'
-    create_cris_projects = 'false'
-
-    # debug CC e-mail address
-    cc = ''
-
-# Start a PDB session and login for use later
-pdb_session_token = utils.pdb_start_session()
-
-# Login to PDB
-if pdb_session_token:
-    utils.pdb_login(pdb_session_token)
-else: 
-    print('\033[91m❌\033[0m ERROR: Could not log in to PDB (no session exists), exiting!')
-    sys.exit(1)
-
-# DSW authentication
-dsw_token = ''
-try:
-    dsw_authurl = dswurl + '/tokens'
-    auth_data = dict(email=dswuser, password=dswpw)
-    data_auth = requests.post(url=dsw_authurl, json=auth_data, headers={'Accept': 'application/json'}).text
-    data_auth = json.loads(data_auth)
-    dsw_token = data_auth['token']
-except requests.exceptions.HTTPError as e:
-    print('\033[91m❌\033[0m ERROR: Could not authenticate with DSW, user: ' + dswuser + ' , existing.')
-    with open(logfile, 'a') as lf:
-        lf.write('\033[91m❌\033[0m ERROR: Could not authenticate with DSW, user: ' + dswuser + ' , exiting: ' + e.response.text)
-    utils.pdb_stop_session(pdb_session_token)
-    sys.exit(1)
-
-headers = {'Accept': 'application/json',
-           'Authorization': 'Bearer ' + dsw_token}
-
-lcounter = 0
+## See README.md for details, the DMPs and CRIS projects are created by pipeline.run()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Sub-commands, handled before the regular command line params
+    if argv and argv[0] == 'sync-gdp':
+        gdp_mirror.main(argv[1:])
+        return
+    if argv and argv[0] == 'sync-cris-persons':
+        cris_persons.main(argv[1:])
+        return
+    if argv and argv[0] == 'shard':
+        shards.shard_command(argv[1:])
+        return
+    if argv and argv[0] == 'merge':
+        shards.merge_command(argv[1:])
+        return
+    if argv and argv[0] == 'audit':
+        audit.main(argv[1:])
+        return
+    if argv and argv[0] == 'logout':
+        sessions.logout()
+        return
+
+    # Command line params
+    parser = ArgumentParser(prog='create-dmp', description='App for creating new DMP(s) and Chalmers CRIS project records from funder grant data. \nUse as (example): create-dmp -i formas_251001.txt -f formas -u y -e y',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-i', '--infile', help='Input file, tab-delimited, with columns: ProjectID, Name (inverted), Email', required=True)
+    parser.add_argument('-f', '--funder', help='Funder name, e.g. formas or vr', required=True)
+    parser.add_argument('-u', '--updateCRIS', help='Create CRIS project record', choices=['y', 'n'], default='y')
+    parser.add_argument('-e', '--sendEmails', help='Send e-mail to new user', choices=['y', 'n'], default='y')
+    parser.add_argument('-w', '--workers', help='Number of concurrent DSW user lookups/creations', type=int, default=4)
+    parser.add_argument('-t', '--trace', help='Write trace spans (run, project, stage, HTTP call) in Chrome trace format to this file')
+    parser.add_argument('-s', '--shard', help='Only process shard k of N of the input file (k/N, e.g. 2/4), see create-dmp shard and merge')
+    parser.add_argument('-y', '--yes', action='store_true', help='Do not ask for confirmation before processing, e.g. for shards started by a script')
+    parser.add_argument('--update', action='store_true', help='Update the existing DMPs (and CRIS projects with -u y) with changed grant metadata instead of creating new ones, no e-mails are sent')
+    parser.add_argument('--no-session-cache', action='store_true', help='Log in to DSW and PDB without using or storing cached tokens')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
+    args = parser.parse_args(argv)
+
+    infile = args.infile.strip()
+    funder_name = args.funder.lower().strip()
+    send_emails = args.sendEmails.lower().strip() == 'y' and not args.update
+    create_cris_projects = args.updateCRIS.lower().strip() == 'y'
+    shard = None
+    if args.shard:
+        try:
+            shard = shards.parse_shard(args.shard.strip())
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        shard = shards.shard_from_filename(infile)
+
+    # Create logfile, example: formas_20231001_121212.log, results are written next to it as .json
+    # Sharded runs get the shard in the name, e.g. formas_shard2of4_20231001_121212.log
+    logfile = funder_name + ('_shard' + str(shard[0]) + 'of' + str(shard[1]) if shard else '') + '_' + datetime.now().strftime("%Y%m%d_%H%M%S") + '.log'
+    results_file = logfile[:-len('.log')] + '.json'
+
+    print("\nVerifying that all looks good before continuing")
+    for _ in range(4):
+        print(".", end="", flush=True)
+        time.sleep(0.1)
+        time.sleep(1)
+    print("\n")
 
-# Open and read input file
-with open(infile) as infile_txt:
-    csv_reader = csv.reader(infile_txt, delimiter='\t')
+    print("✓ Python version: " + str(sys.version_info.major) + "." + str(sys.version_info.minor) + "." + str(sys.version_info.micro))
+
+    # Validate env variables, input etc.
+    if funder_name not in pipeline.funders:
+        print('\033[91m❌\033[0m ERROR: Funder has to be one of "formas", "vr". Please correct this and try again!')
+        sys.exit(1)
+    if send_emails and (not utils.smtp_server or not utils.smtp_port or not utils.smtp_user or not utils.smtp_password or not utils.email_sender):
+        print('\033[91m❌\033[0m ERROR: You have selected to send e-mails, but SMTP settings are not complete in .env file. Please correct this and try again!')
+        sys.exit(1)
+    if os.path.exists(infile) is False or utils.validate_input_file(infile) is False:
+        print("\033[91m❌\033[0m ERROR: Input file " + infile + " does not exist, is not readable or it is not in a proper format, exiting!")
+        sys.exit(1)
+    else:
+        print("✓ Input file " + infile + " exists, is readable and looks fine.")
+    if utils.validate_chalmers_emails(infile):
+        print("✓ All emails in infile are valid Chalmers addresses.")
+    else:
+        print("\033[91m❌\033[0m ERROR: Infile contains non-Chalmers email addresses. You need to fix this before continuing, exiting now!")
+        sys.exit(1)
+    if os.path.exists('create_dmp/.env') is False:
+        print("\033[91m❌\033[0m ERROR: .env settings file does not exist in create_dmp/ directory, exiting!")
+        sys.exit(1)
+    else:
+        print("✓ Settings file exists in current directory.")
+    if os.access('.', os.W_OK):
+        print("✓ Script has write access to the current directory.")
+    if send_emails and utils.test_smtp_connection() is False:
+        print("\033[91m❌\033[0m ERROR: Could not connect to SMTP server using existing settings in .env, exiting!")
+        sys.exit(1)
+    else:
+        print("✓ SMTP mail server connected succesfully.")
 
-    # Count number of lines in input file
-    rows = list(csv.reader(infile_txt, delimiter='\t'))
-    line_count = len(rows)
-    errcount = 0
+    funder = pipeline.funders[funder_name]
+    records = pipeline.read_records(infile)
+    if shard:
+        records = [r for r in records if shards.in_shard(r, *shard)]
+    dswurl = os.getenv("DSW_URL")
 
     print('\nEverything looks good!\n')
     time.sleep(2)
     print("\n", end="")
-    for _ in range(40):  
+    for _ in range(40):
         print("*", end="", flush=True)
-        time.sleep(0.05)  
+        time.sleep(0.05)
     time.sleep(1)
 
     print("\n")
-    print("We are about to process " + str(line_count) + " projects, using the following settings:\n")
+    print("We are about to process " + str(len(records)) + " projects, using the following settings:\n")
     print("Input file: " + infile)
-    print("Funder: " +  ("Vetenskapsrådet (VR)" if funder_name == "vr" else "Formas"))
-    print("Source for project data: " + source)
-    if source == 'gdp':
-        print("GDP API URL: " + gdp_base_url)
-    print("Create CRIS project records: " + ("Yes" if create_cris_projects == "true" else "No"))
-    print("Send e-mail to users automatically: " + ("Yes" if args.sendEmails.lower().strip() == "y" else "No"))
-    print("E-mail template: " + email_template)
-    print("E-mail sender: " + email_sender)
+    if shard:
+        print("Shard: " + str(shard[0]) + " of " + str(shard[1]))
+    print("Funder: " + ("Vetenskapsrådet (VR)" if funder_name == "vr" else "Formas"))
+    print("Source for project data: " + funder['source'])
+    if funder['source'] == 'gdp':
+        print("GDP API URL: " + gdp_mirror.gdp_urls[funder_name])
+        gdp_mirror_db = None if args.update else gdp_mirror.open_existing_mirror()
+        if args.update:
+            print("GDP mirror: not used for updates, project data is revalidated with GDP")
+        elif gdp_mirror_db:
+            print("GDP mirror: " + gdp_mirror.default_mirror_path() + " (last synced: " + str(gdp_mirror.get_last_sync(gdp_mirror_db, funder_name)) + ")")
+            gdp_mirror_db.close()
+        else:
+            print("GDP mirror: none, all project data is fetched live from GDP")
+    print("Local store for GDP/SweCRIS answers: " + httpcache.default_cache_path() + " (revalidated with ETag/If-Modified-Since)")
+    if args.update:
+        print("Mode: update existing DMPs with changed grant metadata, nothing is created (index: " + dmp_index.default_index_path() + ")")
+        print("Update CRIS project records: " + ("Yes" if create_cris_projects else "No"))
+    else:
+        print("Create CRIS project records: " + ("Yes" if create_cris_projects else "No"))
+    if create_cris_projects and not args.update:
+        cris_persons_db = cris_persons.open_existing_snapshot()
+        if cris_persons_db:
+            print("CRIS person snapshot: " + cris_persons.default_snapshot_path() + " (last synced: " + str(cris_persons.get_last_sync(cris_persons_db)) + ")")
+            cris_persons_db.close()
+        else:
+            print("CRIS person snapshot: none, PIs are looked up live in CRIS")
+    print("Send e-mail to users automatically: " + ("Yes" if send_emails else "No"))
+    print("E-mail template: " + funder['email_template'])
+    print("E-mail sender: " + str(utils.email_sender))
     print("DSW URL: " + dswurl)
-    print("KM Package ID: " + packageid)
-    print("Template ID: " + templateid)
+    print("KM Package ID: " + os.getenv("PACKAGE_ID"))
+    print("Template ID: " + os.getenv("TEMPLATE_ID"))
     print("CRIS URL: " + os.getenv("CRIS_URL"))
     print("Logfile: " + logfile)
     print("\n")
     print("Is all the above correct? PLEASE CHECK THIS CAREFULLY!")
     if dswurl.startswith('https://dsw.chalmers.se'):
-        print("\033[91mNOTE: You are about to create new records in the PRODUCTION DSW and CRIS instances!\033[0m")
+        print("\033[91mNOTE: You are about to " + ("update records" if args.update else "create new records") + " in the PRODUCTION DSW and CRIS instances!\033[0m")
     print("\n")
     print("Choose Y/n and press ENTER to continue...")
-    
+
     yes = {'Y'}
     no = {'no', 'n', 'nej', 'No', 'NEJ', 'N'}
-    choice = input().strip()
-    
+    choice = 'Y' if args.yes else input().strip()
+
     if choice in yes:
         print('Ok, continuing...\n')
     elif choice in no:
         print('Ok, exiting...')
-        utils.pdb_stop_session(pdb_session_token)
-        exit()
+        return
     else:
         print('\033[91m❌\033[0m Invalid input, exiting...')
-        utils.pdb_stop_session(pdb_session_token)
-        exit()
-
-    for row in rows:
-        useruuid = ''
-        pw = ''
-
-        # Initial variables, change according to input file
-        # Assumes inverted names, change below otherwise
-        projectid = row[0].strip()
-        print('Processing project ' + projectid)
-        name = row[1].strip()
-        email = row[2].strip().lower()
-        #orcid = row[3]
-        orcid = ''
-        lname = name.split()[0].strip()
-        fname = name.split()[1].strip()
-        dname = fname + ' ' + lname
-        print(dname)
-        auth_data = []
-        newuser_data = []
-        dmp_data = []
-        cris_project = dict()
-        project_cris_id = 0
-        cris_project_url = ''
-
-        # Initialize other parameters 
-        project_title = ''
-        project_title_swe = ''
-        project_desc = ''
-        project_desc_swe = ''
-        project_start = ''
-        project_end = ''
-        
-        if source.lower() == 'swecris' or source == '':
-            # Fetch data from SweCRIS, if not available in the Prisma spreadsheet
-            swecris_url = os.getenv("SWECRIS_URL") + projectid + '_' + funder_suffix
-            swecris_headers = {'Accept': 'application/json',
-                            'Authorization': 'Bearer ' + os.getenv("SWECRIS_API_KEY")}
-            try:
-                swecrisdata = requests.get(url=swecris_url, headers=swecris_headers).text
-                if 'Internal server error' in swecrisdata:
-                    print('ERROR: No data for ' + funder_name + ' id: ' + projectid + '_' + funder_suffix + ' was found in SweCRIS! Skipping to next.')
-                    errcount += 1
-                    continue
-                swecrisdata = json.loads(swecrisdata)
-                print('Got data from SweCRIS!')
-                project_title = swecrisdata['projectTitleEn']
-                project_title_swe = swecrisdata['projectTitleSv']
-                project_desc = swecrisdata['projectAbstractEn']
-                project_desc_swe = swecrisdata['projectAbstractSv']
-                project_start = swecrisdata['projectStartDate']
-                project_end = swecrisdata['projectEndDate']
-                # Note: Project start/end date needs to be 'yyyy-mm-dd' in DSW, comes as 'yyyy-mm-dd hh:ss:sss' from Swecris
-            except requests.exceptions.HTTPError as e:
-                print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: No data for project id: ' + projectid + '_' + funder_suffix + ' was found in SweCRIS! Skipping to next.')
-                with open(logfile, 'a') as lf:
-                        lf.write('No data for ' + funder_name + ' project id: ' + projectid + ' was found in Swecris!\n')
-                print('\n')
-                with open(logfile, 'a') as lf:
-                    lf.write('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: No data for project id: ' + projectid + '_' + funder_suffix + ' was found in SweCRIS! Skipping to next.')
-                    with open(logfile, 'a') as lf:
-                        lf.write('No data for ' + funder_name + ' project id: ' + projectid + ' was found in Swecris!\n')
-                errcount += 1
-                continue
-        elif source.lower() == 'gdp':
-            # Fetch project data from GDP, if not available in the Prisma spreadsheet
-            gdp_url = gdp_base_url + '?diarienummer=' + projectid
-            gdp_headers = {'Accept': 'application/json',
-                            'Authorization': gdp_api_key}
-            try:
-                gdpresponse = requests.get(url=gdp_url, headers=gdp_headers)
-                total_records = gdpresponse.headers.get("x-totalrecords")
-                if total_records == '0':
-                    print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: No data for ' + funder_name + ' project id: ' + projectid + ' was found in GDP! Skipping to next project. This project will need to be handled manually!')
-                    with open(logfile, 'a') as lf:
-                        lf.write('No data for ' + funder_name + ' project id: ' + projectid + ' was found in GDP!\n')
-                    errcount += 1
-                    continue
-                if 'Internal server error' in gdpresponse.text:
-                    print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: No data for ' + funder_name + ' project id: ' + projectid + ' was found in GDP! Skipping to next project. This project will need to be handled manually!')
-                    with open(logfile, 'a') as lf:
-                        lf.write('No data for ' + funder_name + ' project id: ' + projectid + ' was found in GDP!\n')
-                    errcount += 1
-                    continue
-                gdpdata = json.loads(gdpresponse.text)
-                print('Got data from GDP!')
-                project_title = gdpdata[0]['titelEng']
-                project_title_swe = gdpdata[0]['titel']
-                project_desc = gdpdata[0]['beskrivningEng']
-                project_desc_swe = gdpdata[0]['beskrivning']
-                project_start = gdpdata[0]['startdatum']
-                project_end = gdpdata[0]['slutdatum']
-            except requests.exceptions.HTTPError as e:
-                print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: No data for ' + funder_name + ' project id: ' + projectid + ' was found in GDP! Skipping to next project. This project will need to be handled manually!')
-                with open(logfile, 'a') as lf:
-                        lf.write('No data for project id: ' + projectid + ' was found in GDP!\n')
-                print('\n')
-                with open(logfile, 'a') as lf:
-                    lf.write('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: No data for ' + funder_name + ' project id: ' + projectid + ' was found in GDP! Skipping to next project. This project will need to be handled manually!')
-                    with open(logfile, 'a') as lf:
-                        lf.write('No data for ' + funder_name + ' project id: ' + projectid + ' was found in GDP!\n')
-                errcount += 1
-                continue
-        else:
-            print('ERROR: No or wrong Source selected (should be swecris or gdp), exiting!')
-            utils.pdb_stop_session(pdb_session_token)
-            sys.exit(1)
-
-        # Get primary email and ORCID from PDB
-        pdbperson_payload = {
-                "function": "person_dig",
-                "params": [
-                    {"official_emails": email},
-                    {
-                        "orcid": True,
-                        "name": True,
-					    "cid": { "name": True },
-                        "primary_email": True
-                    }
-                ],
-                "session": pdb_session_token
-        }
-
-        pdb_url = os.getenv("PDB_API_URL")
-        pdb_headers = {
-            "Content-Type": "application/json"
-        }
-
-        pdbperson_response = requests.post(pdb_url, headers=pdb_headers, data=json.dumps(pdbperson_payload))
-        if pdbperson_response.status_code == 200:
-            try:
-                pdbperson_result = pdbperson_response.json()
-                #print(pdbperson_result)
-                pdbperson = pdbperson_result['result'][0]
-                primary_email = pdbperson['primary_email']
-                print('Primary email in PDB: ' + primary_email)
-                if 'orcid' in pdbperson:
-                    orcid = pdbperson['orcid']
-                    print('Found ORCID in PDB: ' + orcid)
-            except ValueError:
-                print(pdbperson_response.text)
-                primary_email = email
-                utils.pdb_stop_session(pdb_session_token)
-                exit()
-        else:
-            print(f"ERROR: PDB person lookup failed failed with status code {pdbperson_response.status_code}")
-            primary_email = email
-   
-        # Lookup user in DSW and get Uuid, or create new if user don't exist
-        dsw_getuser = dswurl + '/users?q=' + str(primary_email)
-        userdata = requests.get(url=dsw_getuser, headers=headers).text
-        userdata = json.loads(userdata)
-        if userdata['_embedded']['users']:
-            useruuid = userdata['_embedded']['users'][0]['uuid']
-            print('User exists in DSW! id: ' + str(useruuid))
-        else:
-            print('User DOES NOT exist, creating NEW user!')
-            # Create new user
-            try:
-                newuser_url = dswurl + '/users'
-                pw = ''.join(random.choice(string.ascii_letters) for i in range(44))
-                newuser_data = dict(email=primary_email, lastName=lname, firstName=fname, role='researcher', password=pw,
-                                    affiliation='Chalmers')
-                data_newuser = requests.post(url=newuser_url, json=newuser_data, headers=headers).text
-                data_newuser = json.loads(data_newuser)
-                useruuid = data_newuser['uuid']
-                print('User ' + email + ' created with id: ' + useruuid + ' and pw: ' + pw)
-                # Activate new user
-                user_activate_url = dswurl + '/users/' + useruuid
-                try:
-                    activate_data = dict(email=primary_email, active=True, lastName=lname, firstName=fname, role='researcher',
-                                         affiliation='Chalmers')
-                    data_activate = requests.put(url=user_activate_url, headers=headers).text
-                    print('User: ' + useruuid + ' has been activated.')
-                except requests.exceptions.HTTPError as e:
-                    print('ERROR: Could not activate user with e-mail: ' + primary_email + '.')
-                    with open(logfile, 'a') as lf:
-                        lf.write('ERROR: Could not activate user: ' + primary_email + '.' + e.response.text)
-                    sys.exit(1)
-            except requests.exceptions.HTTPError as e:
-                print('ERROR: Could not create user with e-mail: ' + primary_email + '.')
-                utils.pdb_stop_session(pdb_session_token)
-                sys.exit(1)
-
-        # Create new dmp
-        print('Trying to create new DMP with title: ' + project_title)
-        try:
-            create_dmp_url = dswurl + '/projects'
-            create_data = dict(questionTagUuids=[config.get('Paths', 'question.tag.uuids')], packageId=packageid,
-                               templateId=templateid, visibility='PrivateQuestionnaire',
-                               sharing='RestrictedQuestionnaire', name=project_title,
-                               formatUuid='d3e98eb6-344d-481f-8e37-6a67b6cd1ad2', state='Default', isTemplate=False)
-            data_create = requests.post(url=create_dmp_url, json=create_data, headers=headers).text
-            data_create = json.loads(data_create)
-            dmpuuid = data_create['uuid']
-            print('DMP created with id: ' + str(dmpuuid))
-            lcounter += 1
-        except requests.exceptions.HTTPError as e:
-            print('ERROR: Could not create DMP!')
-            with open(logfile, 'a') as lf:
-                lf.write('ERROR: Could not create DMP!\n')
-            utils.pdb_stop_session(pdb_session_token)
-            sys.exit(1)
-
-        # Add content to dmp
-        # TODO: Add multiple (Chalmers) contributors and external collaborators (when available from GDP)
-
-        # Mandatory field in API, set to default values for all (it will be fine)
-        phases_answered_dict = dict(answeredQuestions=7, indicationType='PhasesAnsweredIndication',
-                                    unansweredQuestions=1)
-
-        start_path = dict(path=config.get('Paths', 'start'),
-                          phasesAnsweredIndication=phases_answered_dict,
-                          value=dict(value=[config.get('Paths', 'contributor.uuid')], type='ItemListReply'),
-                          uuid=str(uuid.uuid4()),
-                          type='SetReplyEvent')
-        name_dict = dict(
-            path=config.get('Paths', 'name.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=dname, type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        email_dict = dict(
-            path=config.get('Paths', 'email.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=primary_email, type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        orcid_dict = dict(
-            path=config.get('Paths', 'orcid.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=orcid, type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        aff_dict = dict(
-            path=config.get('Paths', 'aff.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=config.get('Paths', 'aff.choice.cth'), type='AnswerReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        role_dict = dict(
-            path=config.get('Paths', 'role.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=config.get('Paths', 'role.choice.contact'), type='AnswerReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        project_dict = dict(
-            path=config.get('Paths', 'project.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=['7e2925a6-3e9f-4226-bcaa-4c18ea216933'], type='ItemListReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        project_name_dict = dict(
-            path=config.get('Paths', 'project.name.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=project_title, type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        project_desc_dict = dict(
-            path=config.get('Paths', 'project.desc.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=project_desc, type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        project_start_dict = dict(
-            path=config.get('Paths', 'project.start.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=project_start[0:10], type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        project_end_dict = dict(
-            path=config.get('Paths', 'project.end.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=project_end[0:10], type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        funding_dict = dict(
-            path=config.get('Paths', 'funding.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=['7e2925a6-3e9f-4226-bcaa-4c18ea216933'], type='ItemListReply'),
-            type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        funder_dict = dict(
-            path=config.get('Paths', 'funder.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=dict(value=funder_display_name, id=funderid, type=dsw_integration_type), type='IntegrationReply'),
-            type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        project_status_dict = dict(
-            path=config.get('Paths', 'status.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=config.get('Paths', 'status.choice.granted'), type='AnswerReply'), 
-            type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        grantid_dict = dict(
-            path=config.get('Paths', 'grant.id.path'),
-            phasesAnsweredIndication=phases_answered_dict,
-            value=dict(value=projectid, type='StringReply'), type='SetReplyEvent',
-            uuid=str(uuid.uuid4()))
-        phase_dict = dict(
-            phaseUuid=config.get('Paths', 'phase.uuid'),
-            phasesAnsweredIndication=phases_answered_dict,
-            type='SetPhaseEvent',
-            uuid=str(uuid.uuid4())
-        )    
-
-        dmp_data = dict(events=[start_path, name_dict, email_dict, orcid_dict, aff_dict, role_dict, project_dict,
-                                project_name_dict, project_desc_dict, project_start_dict, project_end_dict,
-                                funding_dict, funder_dict, project_status_dict, grantid_dict, phase_dict])
-        try:
-            newdmp_url = dswurl + '/projects/' + dmpuuid + '/content'
-            data_newdmp = requests.put(url=newdmp_url, json=dmp_data, headers=headers).text
-            print('DMP updated with content.')
-        except requests.exceptions.HTTPError as e:
-            print('ERROR: Could not update DMP with content.')
-            utils.pdb_stop_session(pdb_session_token)
-            sys.exit(1)
-
-        # Alter ownership of dmp
-        dmp_owner_data = dict(
-            sharing='RestrictedQuestionnaire', visibility='PrivateQuestionnaire',
-            permissions=[dict(memberType='UserQuestionnairePermType',
-                memberUuid=useruuid, perms=['VIEW', 'COMMENT', 'EDIT', 'ADMIN'])]
-        )
-        
-        try:
-            dmpowner_url = dswurl + '/projects/' + dmpuuid + '/share'
-            data_dmpowner = requests.put(url=dmpowner_url, json=dmp_owner_data, headers=headers).text
-            print('DMP changed owner to ' + useruuid)
-        except requests.exceptions.HTTPError as e:
-            print('ERROR: Could not alter DMP permissions!')
-            utils.pdb_stop_session(pdb_session_token)
-            sys.exit(1)
-
-        # Create Project in Chalmers CRIS (if selected)
-        # Issue alert(s) to create project manually in case no person is found or something else fails
-
-        if create_cris_projects == 'true':
-            dmp_url = os.getenv("DSW_UI_URL") + '/projects/' + dmpuuid
-            cris_project_url = ''
-            # Check if Project already exists
-            cris_check_url = os.getenv("CRIS_API_URL") + '/ProjectSearch?query="' + projectid + '"+AND+"' + cris_funder_id + '"'
-            checkdata = requests.get(url=cris_check_url, headers={'Accept': 'application/json'}).text
-            checkdata = json.loads(checkdata)
-            if checkdata['TotalCount'] == 1:
-                print("\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m Project " + projectid + " already exists in CRIS. Add DMP to project " + projectid + " manually!")
-                errcount += 1
-                project_cris_id = 0
-            else:
-                print("A new CRIS project record will be created for project " + projectid)
-                # Create CRIS Project object
-                current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-                contract_org = dict(Id=cris_funder_id)
-                contract_id = dict(ProjectContractIdentifierID=2, ProjectContractIdentifierValue=projectid)
-                contract = dict(ContractSource='dsw', ContractStartDate=project_start[0:10] + 'T00:00:00',
-                                ContractEndDate=project_end[0:10] + 'T00:00:00', DmpValue=dmp_url, DmpVersion=1,
-                                ContractOrganization=contract_org, OrganizationID=cris_funder_id,
-                                ContractIdentifiers=[contract_id], CreatedDate=current_date, CreatedBy='dsw')
-                
-                # Get Person from CRIS using e-mail address
-                # If we already have Research Person IDs, the first step could be skipped
-
-                person_get_url = os.getenv("CRIS_PERSON_URL") + '/Persons?idValue=' + primary_email + '&idTypeValue=EMAIL'
-                person_crisdata = requests.get(url=person_get_url, headers={'Accept': 'application/json'}).text
-                person_crisdata = json.loads(person_crisdata)
-                # If person is not found in CRIS
-                if person_crisdata['TotalCount'] == 0:
-                    print("Person with e-mail " + primary_email + " not found in CRIS, trying input email...")
-                    # Try using email from input instead
-                    person_get_url = os.getenv("CRIS_PERSON_URL") + '/Persons?idValue=' + email + '&idTypeValue=EMAIL'
-                    person_crisdata = requests.get(url=person_get_url, headers={'Accept': 'application/json'}).text
-                    person_crisdata = json.loads(person_crisdata)
-                    if person_crisdata['TotalCount'] == 0:
-                        print("Person with e-mail " + email + " not found in CRIS, trying ORCID...")
-                        # Try using orcid instead if we have it
-                        if orcid != '':
-                            person_get_url = os.getenv("CRIS_PERSON_URL") + '/Persons?idValue=' + orcid + '&idTypeValue=ORCID'
-                            person_crisdata = requests.get(url=person_get_url, headers={'Accept': 'application/json'}).text
-                            person_crisdata = json.loads(person_crisdata)
-                            # If still not found, skip and add project manually
-                            if person_crisdata['TotalCount'] == 0:
-                                print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m No Person with e-mail ' + primary_email + ' or ORCID ' + orcid + ' found in CRIS. Add project ' + projectid + ' manually!')
-                                print('\n')
-                                project_cris_id = 0
-                                # Print output to logfile, send mail and continue with next
-                                current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-                                # Create and send email if all is fine (and we have selected to do do)
-                                if args.sendEmails.lower().strip() == "y":
-                                    try:
-                                        utils.send_html_email(primary_email, dname, 'Gratulerar till beviljat forskningsbidrag! / Congratulations on your grant approval!', email_template, projectid, project_title, dmp_url, cris_project_url)
-                                    except Exception as e:
-                                        print(f"\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: Failed to send email to {primary_email}: {e}")
-                                        errcount += 1
-                                        with open(logfile, 'a') as lf:
-                                            lf.write(f"ERROR: Failed to send email to {primary_email}: {e}\n")
-                                with open(logfile, 'a') as lf:
-                                    lf.write(
-                                        current_date + '\t' + projectid + '\t' + project_title + '\t' + fname + ' ' + lname + '\t' + primary_email + '\t' + os.getenv(
-                                            "DSW_UI_URL") + '/projects/' + dmpuuid + '\t' + str(
-                                            project_cris_id) + '\t' + cris_project_url + '\n')
-                                print('\n')
-                                errcount += 1
-                                continue
-                        else:
-                            print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m No Person with e-mail ' + primary_email + ' or ORCID ' + orcid + ' found in CRIS. Add project ' + projectid + ' manually!')
-                            print('\n')
-                            project_cris_id = 0
-                            # Print output to logfile, send mail and continue with next
-                            current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-                            # Create and send email if all is fine (and we have selected to do do)
-                            if args.sendEmails.lower().strip() == "y":
-                                try:
-                                    utils.send_html_email(primary_email, dname, 'Gratulerar till beviljat forskningsbidrag! / Congratulations on your grant approval!', email_template, projectid, project_title, dmp_url, cris_project_url)
-                                except Exception as e:
-                                    print(f"\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: Failed to send email to {primary_email}: {e}")
-                                    errcount += 1
-                                    with open(logfile, 'a') as lf:
-                                        lf.write(f"ERROR: Failed to send email to {primary_email}: {e}\n")
-                            with open(logfile, 'a') as lf:
-                                lf.write(
-                                    current_date + '\t' + projectid + '\t' + project_title + '\t' + fname + ' ' + lname + '\t' + primary_email + '\t' + os.getenv(
-                                        "DSW_UI_URL") + '/projects/' + dmpuuid + '\t' + str(
-                                        project_cris_id) + '\t' + cris_project_url + '\n')
-                            print('\n')
-                            errcount += 1
-                            continue
-                
-                # If found, cet Person CRIS ID and create Person object for CRIS Project
-                person_cris_id = str(person_crisdata['Persons'][0]['Id'])
-
-                persons = []
-                person = dict()
-                
-                # Get Person current Org home from CRIS
-                person_org_cris_id = ''
-                # person_orghome_name = ''
-                person_org = dict()
-                try:
-                    person_org_get_url = os.getenv("CRIS_PERSON_URL") + '/Persons/' + person_cris_id + '/OrganizationHomes?year=' + os.getenv("CRIS_YEAR") + '&currentOnly=true&maxLevelDepartment=true'
-                    person_org_crisdata = requests.get(url=person_org_get_url,
-                                                       headers={'Accept': 'application/json'}).text
-                    person_org_crisdata = json.loads(person_org_crisdata)
-                    person_org_cris_id = person_org_crisdata['OrganizationId']
-                    # person_orghome_name = person_org_crisdata['OrganizationData']['OrganizationParents'][0]['ParentOrganizationData']['DisplayNameSwe']
-                    person_org = dict(OrganizationID=person_org_cris_id)
-                except requests.exceptions.HTTPError as e:
-                    print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m Person org lookup failed. Add project ' + projectid + ' manually!')
-                    errcount += 1
-                    print('\n')
-                    project_cris_id = 0
-                    # Print output to logfile and continue with next
-                    current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-                    # Create and send email if all is fine (and we have selected to do do)
-                    if args.sendEmails.lower().strip() == "y":
-                        try:
-                            utils.send_html_email(primary_email, dname, 'Gratulerar till beviljat forskningsbidrag! / Congratulations on your grant approval!', email_template, projectid, project_title, dmp_url, cris_project_url)
-                        except Exception as e:
-                            print(f"\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: Failed to send email to {primary_email}: {e}")
-                    with open(logfile, 'a') as lf:
-                        lf.write(
-                            current_date + '\t' + projectid + '\t' + project_title + '\t' + fname + ' ' + lname + '\t' + primary_email + '\t' + os.getenv(
-                                "DSW_UI_URL") + '/projects/' + dmpuuid + '\t' + str(
-                                project_cris_id) + '\t' + cris_project_url + '\n')
-                    print('\n')
-                    errcount += 1
-                    continue
-
-                person = dict(PersonID=person_cris_id, PersonOrganizations=[person_org], PersonRoleID=1)
-
-                project_start_cris = project_start[0:10] + 'T00:00:00'
-                project_end_cris = project_end[0:10] + 'T00:00:00'
-
-                cris_project = dict(
-                    ProjectTitleEng=project_title, ProjectTitleSwe=project_title_swe,
-                    ProjectDescriptionEng=project_desc,
-                    ProjectDescriptionEngHtml='<p>' + project_desc + '</p>', PublishStatus=1,
-                    ProjectDescriptionSwe=project_desc_swe,
-                    ProjectDescriptionSweHtml='<p>' + project_desc_swe + '</p>',
-                    StartDate=project_start_cris,
-                    EndDate=project_end_cris, ProjectSource='SweCRIS', CreatedDate=current_date,
-                    CreatedBy='dsw',
-                    Contracts=[contract], Persons=[person]
-                )
-
-                # Add Project to CRIS
-                create_project_url = os.getenv("CRIS_API_URL") + '/Projects'
-                try:
-                    project_create = requests.post(url=create_project_url, json=cris_project, headers=headers).text
-                    project_create = json.loads(project_create)
-                    #print(project_create)
-                    project_cris_id = project_create['ID']
-                    print('Project ' + projectid + ' created with id: ' + str(project_cris_id))
-                    cris_project_url = os.getenv("CRIS_URL") + '/en/project/' + str(project_cris_id)
-                except requests.exceptions.HTTPError as e:
-                    print('\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m Could NOT create Project with name: ' + project_title + ' in CRIS. Add ' + projectid + ' manually!')
-                    errcount += 1
-                    # Print output to logfile and continue with next
-                    # Create and send email if all is fine (and we have selected to do do)
-                    if args.sendEmails.lower().strip() == "y":
-                        try:
-                            utils.send_html_email(primary_email, dname, 'Gratulerar till beviljat forskningsbidrag! / Congratulations on your grant approval!', email_template, projectid, project_title, dmp_url, cris_project_url)
-                        except Exception as e:
-                            print(f"\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: Failed to send email to {primary_email}: {e}")
-                    current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-                    with open(logfile, 'a') as lf:
-                        lf.write(
-                            current_date + '\t' + projectid + '\t' + project_title + '\t' + fname + ' ' + lname + '\t' + primary_email + '\t' + os.getenv(
-                                "DSW_UI_URL") + '/projects/' + dmpuuid + '\t' + str(
-                                project_cris_id) + '\t' + cris_project_url + '\n')
-                    print('\n')
-                    continue
-
-        # Create and send email if all is fine (and we have selected to do do)
-        if args.sendEmails.lower().strip() == "y":
-            try:
-                utils.send_html_email(primary_email, dname, 'Gratulerar till beviljat forskningsbidrag! / Congratulations on your grant approval!', email_template, projectid, project_title, dmp_url, cris_project_url)
-            except Exception as e:
-                print(f"\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m ERROR: Failed to send email to {primary_email}: {e}")
-                errcount += 1
-                with open(logfile, 'a') as lf:
-                    lf.write(f"ERROR: Failed to send email to {primary_email}: {e}\n")
-
-        # Ready
-        # Print output to logfile and continue with next
-        current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
-        with open(logfile, 'a') as lf:
-            lf.write(
-                current_date + '\t' + projectid + '\t' + project_title + '\t' + fname + ' ' + lname + '\t' + primary_email + '\t' + os.getenv(
-                    "DSW_UI_URL") + '/projects/' + dmpuuid + '\t' + str(
-                    project_cris_id) + '\t' + cris_project_url + '\n')
-        print('\n')
-        #lcounter += 1
-
-print('\n******************************\n')
-print('All done! Processed ' + str(lcounter) + ' projects, with ' + str(errcount) + ' issue(s). Output has been logged to ' + str(logfile) + '. If there were issues (see above), these will have to be fixed manually. Exiting now...\n')
-utils.pdb_stop_session(pdb_session_token)
-exit()
+        sys.exit(1)
+
+    options = dict(update_cris=create_cris_projects, send_emails=send_emails, workers=args.workers, logfile=logfile,
+                   session_cache=not args.no_session_cache, update=args.update)
+    if args.trace:
+        tracing.enable()
+    try:
+        summary = pipeline.run(records, funder_name, options)
+    except pipeline.PipelineError as e:
+        print('\033[91m❌\033[0m ERROR: ' + str(e) + ', exiting!')
+        sys.exit(1)
+    finally:
+        if args.trace:
+            tracing.export(args.trace)
+
+    summary['infile'] = infile
+    summary['shard'] = str(shard[0]) + '/' + str(shard[1]) if shard else None
+    with open(results_file, 'w', encoding='utf-8') as rf:
+        json.dump(summary, rf, ensure_ascii=False, indent=2)
+
+    for backend, state in summary['backends'].items():
+        if state['times_opened']:
+            print('\033[91m!!!\033[0m Circuit breaker for ' + backend + ' opened ' + str(state['times_opened']) + ' time(s) during the run, ' + str(state['rejected_calls']) + ' call(s) failed immediately.')
+
+    # Projects deferred because a backend was unavailable, in input file format so they can be run again with -i
+    deferred = [r for r in summary['results'] if r['status'] == 'deferred']
+    if deferred:
+        deferred_file = logfile[:-len('.log')] + '_deferred.txt'
+        pipeline.write_records(deferred_file, deferred)
+        print('\033[91m!!!\033[0m ' + str(len(deferred)) + ' project(s) were deferred, run them again later with: create-dmp -i ' + deferred_file + ' -f ' + funder_name)
+
+    print('\n******************************\n')
+    if args.update:
+        print('Updated ' + str(summary['updated']) + ' project(s), ' + str(summary['unchanged']) + ' unchanged.')
+    print('All done! Processed ' + str(summary['processed']) + ' projects, with ' + str(summary['issues']) + ' issue(s). Output has been logged to ' + str(logfile) + ' and ' + results_file + '. If there were issues (see above), these will have to be fixed manually. Exiting now...\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,907 @@
+import os
+import csv
+import json
+import time
+import uuid
+import configparser
+from datetime import datetime
+import requests
+from dotenv import load_dotenv
+from . import utils
+from . import dsw
+from . import gdp_mirror
+from . import cris_persons
+from . import dmp_index
+from . import tracing
+from . import backends
+from . import httpcache
+from . import sessions
+
+## Pipeline for creating new DMPs in Chalmers DSW and project records in Chalmers CRIS from funder grant data
+## Used by the create-dmp command line tool (main.py), other services can call it directly:
+##     from create_dmp import pipeline
+##     summary = pipeline.run(pipeline.read_records('formas_251030.txt'), 'formas', dict(send_emails=False))
+
+# Settings
+base_dir = os.path.dirname(os.path.abspath(__file__))
+env_path = os.path.join(base_dir, '.env')
+load_dotenv(dotenv_path=env_path)
+
+# DSW < 4.22 compatibility fix
+# Set to 'IntegrationType' for DSW version < 4.22, IntegrationLegacyType otherwise (if the old type is still used in KM)
+dsw_integration_type = 'IntegrationLegacyType'
+
+# Read config
+config = configparser.ConfigParser()
+config_path = os.path.join(base_dir, 'create-new-dmp.conf')
+with open(config_path) as f:
+    config.read_file(f)
+
+# Funder specific params, adding a funder requires a new entry (and e-mail template)
+funders = {
+    'formas': dict(
+        source='gdp',
+        email_template='mail_template_formas.html',
+        funderid='https://ror.org/03pjs1y45',
+        funder_suffix='Formas',
+        funder_display_name='Formas',
+        cris_funder_id='7f93013d-43bd-40f0-b0eb-fe21dc95c745'
+    ),
+    'vr': dict(
+        source='gdp',
+        email_template='mail_template_vr.html',
+        funderid='https://ror.org/03yrm4c26',
+        funder_suffix='VR',
+        funder_display_name='Vetenskapsrådet / Swedish Research Council (VR)',
+        cris_funder_id='0d84752e-ee44-485f-b889-bcbe3cf6b095'
+    )
+}
+
+default_options = dict(
+    update_cris=True,   # Create CRIS project records
+    send_emails=True,   # Send e-mail to the researchers
+    workers=4,          # Concurrent DSW user lookups/creations
+    logfile=None,       # Tab separated result lines and errors are appended here, if set
+    http_cache=True,    # Keep GDP/SweCRIS answers in a local body store and revalidate them (see httpcache.py)
+    session_cache=True, # Reuse the DSW token and PDB session of earlier runs while valid (see sessions.py)
+    update=False        # Update the DMPs/CRIS projects of earlier runs with changed grant metadata, nothing is created
+)
+
+email_subject = 'Gratulerar till beviljat forskningsbidrag! / Congratulations on your grant approval!'
+alert = '\033[91m!\033[0m\033[91m!\033[0m\033[91m!\033[0m'
+
+
+class PipelineError(Exception):
+    # Raised when a run cannot start, e.g. unknown funder or failing PDB/DSW login
+    pass
+
+
+def read_records(infile):
+    # Input file, tab-delimited, with columns (no headers): ProjectID, Name (inverted), Email
+    with open(infile, encoding='utf-8') as infile_txt:
+        return [dict(projectid=row[0].strip(), name=row[1].strip(), email=row[2].strip().lower())
+                for row in csv.reader(infile_txt, delimiter='\t')]
+
+
+def write_records(path, results):
+    # Results written back in input file format, e.g. deferred projects that should be run again
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for r in results:
+            f.write(r['projectid'] + '\t' + r['lname'] + ' ' + r['fname'] + '\t' + r['input_email'] + '\n')
+
+
+def write_log(context, line):
+    if context['options']['logfile']:
+        with open(context['options']['logfile'], 'a') as lf:
+            lf.write(line + '\n')
+
+
+def add_issue(context, result, message):
+    # Something needs to be handled manually for this project
+    print(alert + ' ' + message)
+    result['issues'].append(message)
+    write_log(context, message)
+
+
+def new_result(record, owner):
+    # Assumes inverted names, change below otherwise
+    lname = record['name'].split()[0].strip()
+    fname = record['name'].split()[1].strip()
+    return dict(
+        projectid=record['projectid'],
+        name=fname + ' ' + lname,
+        fname=fname,
+        lname=lname,
+        input_email=record['email'],
+        owner_email=owner['primary_email'],
+        orcid=owner['orcid'],
+        owner_uuid=None,
+        title='',
+        dmp_uuid=None,
+        dmp_url='',
+        cris_project_id=0,
+        cris_project_url='',
+        email_sent=False,
+        updated_fields=[],  # --update: fields changed in DSW/CRIS, e.g. dsw:title
+        status='failed',    # created, created_with_issues, deferred (backend unavailable) or failed (no DMP)
+                            # --update: updated, updated_with_issues or unchanged instead of created
+        issues=[],
+        duration=None
+    )
+
+
+def defer(context, result, backend, error=None):
+    # A backend the project needs is unavailable (circuit breaker open, timeout, connection error or 5xx), leave the project for a later run
+    result['status'] = 'deferred'
+    add_issue(context, result, 'DEFERRED: ' + backend + ' is unavailable' + (' (' + str(error) + ')' if error else '') + ', project id: ' + result['projectid'] + ' was not processed. Run it again later (see the _deferred.txt file)!')
+
+
+def log_result(context, result):
+    current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+    write_log(context, current_date + '\t' + result['projectid'] + '\t' + result['title'] + '\t' + result['name'] + '\t' +
+              result['owner_email'] + '\t' + result['dmp_url'] + '\t' + str(result['cris_project_id']) + '\t' +
+              result['cris_project_url'])
+
+
+def lookup_owner(context, record):
+    try:
+        return utils.pdb_person_lookup(context['pdb_session_token'], record['email'])
+    except utils.PDBSessionError:
+        # Cached session has expired in PDB, start a new one and try again
+        print('PDB session was not accepted, logging in again...')
+        try:
+            context['pdb_session_token'] = sessions.pdb_session(context['options']['session_cache'], force_login=True)
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            raise PipelineError('Could not start a new PDB session: ' + str(e))
+        try:
+            return utils.pdb_person_lookup(context['pdb_session_token'], record['email'])
+        except utils.PDBSessionError as e:
+            raise PipelineError('PDB did not accept a new session either: ' + str(e))
+
+
+def resolve_owners(context, records):
+    """
+    Look up all project owners in PDB (primary e-mail, ORCID).
+    Owners that could not be looked up because PDB did not respond get pdb_unavailable=True, their projects
+    are deferred, as the input e-mail may be an alias and would give the owner a second DSW user.
+    """
+    owners = []
+    with tracing.span('resolve-owners', rows=len(records)) as span:
+        for record in records:
+            try:
+                primary_email, orcid = lookup_owner(context, record)
+                owners.append(dict(primary_email=primary_email, orcid=orcid))
+            except requests.exceptions.RequestException as e:
+                print(alert + ' PDB person lookup for e-mail ' + record['email'] + ' failed (' + str(e) + '), project id: ' + record['projectid'] + ' will be deferred.')
+                owners.append(dict(primary_email=record['email'], orcid='', pdb_unavailable=True))
+        span['unavailable'] = sum(1 for owner in owners if owner.get('pdb_unavailable'))
+    return owners
+
+
+def provision_owners(context, records, owners):
+    # Make sure all owners exist in DSW before creating any DMPs
+    dsw_users = dict()
+    for record, owner in zip(records, owners):
+        if owner.get('pdb_unavailable'):
+            # Not known which DSW user this is, the project is deferred
+            continue
+        lname = record['name'].split()[0].strip()
+        fname = record['name'].split()[1].strip()
+        dsw_users.setdefault(owner['primary_email'], (fname, lname))
+
+    print('\nProvisioning ' + str(len(dsw_users)) + ' DSW user(s)...')
+    with tracing.span('provision-users', users=len(dsw_users)) as span:
+        dsw_ready, dsw_created, dsw_failed, context['dsw_unavailable'] = dsw.provision_users(context['dsw_session'], context['dswurl'], dsw_users,
+                                                                                             workers=context['options']['workers'])
+        span['created'] = len(dsw_created)
+        span['failed'] = len(dsw_failed)
+    for newuser_email in dsw_created:
+        print('User ' + newuser_email + ' created and activated with id: ' + dsw_ready[newuser_email])
+    for failed_email, error in dsw_failed.items():
+        print(alert + ' ERROR: Could not create or activate DSW user ' + failed_email + ', DMPs for this user will NOT be created!')
+        write_log(context, 'ERROR: Could not create or activate user: ' + failed_email + '. ' + error)
+    print('✓ ' + str(len(dsw_ready)) + ' DSW user(s) ready (' + str(len(dsw_created)) + ' new), ' + str(len(dsw_failed)) + ' failed.\n')
+    return dsw_ready, dsw_created, dsw_failed
+
+
+def fetch_metadata(context, backend, url, headers):
+    # Project metadata lookups are idempotent (hedged) and revalidated against the local body store, if used
+    if context['http_cache']:
+        return httpcache.get(context['http_cache'], backend, url, headers=headers, hedge=True)
+    return utils.http_request(backend, 'GET', url, hedge=True, headers=headers)
+
+
+def fetch_swecris(context, projectid):
+    # Fetch data from SweCRIS, if not available in the Prisma spreadsheet
+    swecris_url = os.getenv("SWECRIS_URL") + projectid + '_' + context['funder_suffix']
+    swecris_headers = {'Accept': 'application/json',
+                       'Authorization': 'Bearer ' + os.getenv("SWECRIS_API_KEY")}
+    swecrisresponse = fetch_metadata(context, 'swecris', swecris_url, swecris_headers)
+    # A failing SweCRIS is not the same as a project missing from it
+    if backends.is_failure(response=swecrisresponse):
+        swecrisresponse.raise_for_status()
+    if 'Internal server error' in swecrisresponse.text:
+        return None
+    swecrisresponse.raise_for_status()
+    swecrisdata = swecrisresponse.json()
+    print('Got data from SweCRIS!')
+    # Note: Project start/end date needs to be 'yyyy-mm-dd' in DSW, comes as 'yyyy-mm-dd hh:ss:sss' from Swecris
+    return dict(title=swecrisdata['projectTitleEn'], title_swe=swecrisdata['projectTitleSv'],
+                desc=swecrisdata['projectAbstractEn'], desc_swe=swecrisdata['projectAbstractSv'],
+                start=swecrisdata['projectStartDate'], end=swecrisdata['projectEndDate'])
+
+
+def fetch_gdp(context, projectid):
+    # Project data from the local GDP mirror, or from GDP if not available in the Prisma spreadsheet or the mirror
+    gdpdata = None
+    if context['gdp_mirror_db']:
+        gdpdata = gdp_mirror.get_activity(context['gdp_mirror_db'], context['funder_name'], projectid)
+        if gdpdata:
+            print('Got data from GDP mirror!')
+    if not gdpdata:
+        gdp_url = gdp_mirror.gdp_urls[context['funder_name']] + '?diarienummer=' + projectid
+        gdp_headers = {'Accept': 'application/json',
+                       'Authorization': os.getenv(gdp_mirror.gdp_api_key_envs[context['funder_name']])}
+        gdpresponse = fetch_metadata(context, 'gdp', gdp_url, gdp_headers)
+        gdpresponse.raise_for_status()
+        total_records = gdpresponse.headers.get("x-totalrecords")
+        if total_records == '0' or 'Internal server error' in gdpresponse.text:
+            return None
+        gdpdata = json.loads(gdpresponse.text)[0]
+        print('Got data from GDP!')
+        if context['gdp_mirror_db']:
+            gdp_mirror.store_activity(context['gdp_mirror_db'], context['funder_name'], gdpdata)
+            context['gdp_mirror_db'].commit()
+    return dict(title=gdpdata['titelEng'], title_swe=gdpdata['titel'],
+                desc=gdpdata['beskrivningEng'], desc_swe=gdpdata['beskrivning'],
+                start=gdpdata['startdatum'], end=gdpdata['slutdatum'])
+
+
+def fetch_project_data(context, result):
+    projectid = result['projectid']
+    source_name = 'SweCRIS' if context['source'] == 'swecris' else 'GDP'
+    try:
+        if context['source'] == 'swecris':
+            project = fetch_swecris(context, projectid)
+        else:
+            project = fetch_gdp(context, projectid)
+    except backends.CircuitOpenError as e:
+        defer(context, result, e.backend)
+        return None
+    except requests.exceptions.RequestException as e:
+        if backends.is_unavailable(e):
+            defer(context, result, context['source'], e)
+            return None
+        add_issue(context, result, 'ERROR: Could not get data for ' + context['funder_name'] + ' project id: ' + projectid + ' from ' + source_name + ' (' + str(e) + ')! Skipping to next project. This project will need to be handled manually!')
+        return None
+    except (ValueError, KeyError, IndexError):
+        project = None
+    if project is None:
+        add_issue(context, result, 'ERROR: No data for ' + context['funder_name'] + ' project id: ' + projectid + ' was found in ' + source_name + '! Skipping to next project. This project will need to be handled manually!')
+    return project
+
+
+def build_dmp_content(context, result, project):
+    # Add content to dmp
+    # TODO: Add multiple (Chalmers) contributors and external collaborators (when available from GDP)
+
+    # Mandatory field in API, set to default values for all (it will be fine)
+    phases_answered_dict = dict(answeredQuestions=7, indicationType='PhasesAnsweredIndication',
+                                unansweredQuestions=1)
+
+    start_path = dict(path=config.get('Paths', 'start'),
+                      phasesAnsweredIndication=phases_answered_dict,
+                      value=dict(value=[config.get('Paths', 'contributor.uuid')], type='ItemListReply'),
+                      uuid=str(uuid.uuid4()),
+                      type='SetReplyEvent')
+    name_dict = dict(
+        path=config.get('Paths', 'name.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=result['name'], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    email_dict = dict(
+        path=config.get('Paths', 'email.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=result['owner_email'], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    orcid_dict = dict(
+        path=config.get('Paths', 'orcid.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=result['orcid'], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    aff_dict = dict(
+        path=config.get('Paths', 'aff.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=config.get('Paths', 'aff.choice.cth'), type='AnswerReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    role_dict = dict(
+        path=config.get('Paths', 'role.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=config.get('Paths', 'role.choice.contact'), type='AnswerReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    project_dict = dict(
+        path=config.get('Paths', 'project.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=['7e2925a6-3e9f-4226-bcaa-4c18ea216933'], type='ItemListReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    project_name_dict = dict(
+        path=config.get('Paths', 'project.name.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=project['title'], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    project_desc_dict = dict(
+        path=config.get('Paths', 'project.desc.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=project['desc'], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    project_start_dict = dict(
+        path=config.get('Paths', 'project.start.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=project['start'][0:10], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    project_end_dict = dict(
+        path=config.get('Paths', 'project.end.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=project['end'][0:10], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    funding_dict = dict(
+        path=config.get('Paths', 'funding.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=['7e2925a6-3e9f-4226-bcaa-4c18ea216933'], type='ItemListReply'),
+        type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    funder_dict = dict(
+        path=config.get('Paths', 'funder.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=dict(value=context['funder_display_name'], id=context['funderid'], type=dsw_integration_type), type='IntegrationReply'),
+        type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    project_status_dict = dict(
+        path=config.get('Paths', 'status.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=config.get('Paths', 'status.choice.granted'), type='AnswerReply'),
+        type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    grantid_dict = dict(
+        path=config.get('Paths', 'grant.id.path'),
+        phasesAnsweredIndication=phases_answered_dict,
+        value=dict(value=result['projectid'], type='StringReply'), type='SetReplyEvent',
+        uuid=str(uuid.uuid4()))
+    phase_dict = dict(
+        phaseUuid=config.get('Paths', 'phase.uuid'),
+        phasesAnsweredIndication=phases_answered_dict,
+        type='SetPhaseEvent',
+        uuid=str(uuid.uuid4())
+    )
+
+    return dict(events=[start_path, name_dict, email_dict, orcid_dict, aff_dict, role_dict, project_dict,
+                        project_name_dict, project_desc_dict, project_start_dict, project_end_dict,
+                        funding_dict, funder_dict, project_status_dict, grantid_dict, phase_dict])
+
+
+def create_dmp(context, result, project):
+    # Create new dmp, add content and share it with the owner
+    dmp_data = build_dmp_content(context, result, project)
+    dmp_owner_data = dict(
+        sharing='RestrictedQuestionnaire', visibility='PrivateQuestionnaire',
+        permissions=[dict(memberType='UserQuestionnairePermType',
+            memberUuid=result['owner_uuid'], perms=['VIEW', 'COMMENT', 'EDIT', 'ADMIN'])]
+    )
+    create_data = dict(questionTagUuids=[config.get('Paths', 'question.tag.uuids')], packageId=os.getenv("PACKAGE_ID"),
+                       templateId=os.getenv("TEMPLATE_ID"), visibility='PrivateQuestionnaire',
+                       sharing='RestrictedQuestionnaire', name=project['title'],
+                       formatUuid='d3e98eb6-344d-481f-8e37-6a67b6cd1ad2', state='Default', isTemplate=False)
+    print('Trying to create new DMP with title: ' + project['title'])
+    try:
+        dmpuuid = dsw.create_dmp_project(context['dsw_session'], context['dswurl'], create_data, dmp_data, dmp_owner_data)
+    except dsw.LeftoverDMPError as e:
+        error = e.cause.response.text if getattr(e.cause, 'response', None) is not None else str(e.cause)
+        add_issue(context, result, 'ERROR: DMP ' + e.dmp_uuid + ' for project id: ' + result['projectid'] + ' was created but could not be filled or shared, and could not be deleted either. Delete it in DSW (' +
+                  os.getenv("DSW_UI_URL") + '/projects/' + e.dmp_uuid + ') before the project is run again! ' + error)
+        return False
+    except dsw.RolledBackDMPError as e:
+        if backends.is_unavailable(e.cause):
+            # The new DMP was deleted again, the project can simply be run again
+            defer(context, result, 'dsw', e.cause)
+            return False
+        error = e.cause.response.text if getattr(e.cause, 'response', None) is not None else str(e.cause)
+        add_issue(context, result, 'ERROR: Could not fill or share the DMP for project id: ' + result['projectid'] + ', it was deleted again and nothing was saved in DSW. This project will need to be handled manually! ' + error)
+        return False
+    except backends.CircuitOpenError as e:
+        defer(context, result, e.backend)
+        return False
+    except requests.exceptions.RequestException as e:
+        if backends.never_sent(e):
+            # The create call never reached DSW (connect timeout, connection refused), the project can simply be run again
+            defer(context, result, 'dsw', e)
+            return False
+        error = e.response.text if e.response is not None else str(e)
+        if backends.is_unavailable(e):
+            # A timeout or 5xx on the create call can come after DSW has created the project, running it again could make a second DMP
+            add_issue(context, result, 'ERROR: Creating the DMP for project id: ' + result['projectid'] + ' failed without a clear answer from DSW, it may still have been created. Look for a DMP named "' +
+                      project['title'] + '" in DSW before the project is run again! ' + error)
+            return False
+        add_issue(context, result, 'ERROR: Could not create DMP for project id: ' + result['projectid'] + ', nothing was saved in DSW. This project will need to be handled manually! ' + error)
+        return False
+    result['dmp_uuid'] = dmpuuid
+    result['dmp_url'] = os.getenv("DSW_UI_URL") + '/projects/' + dmpuuid
+    print('DMP created with id: ' + str(dmpuuid) + ', content added and owner changed to ' + result['owner_uuid'])
+    return True
+
+
+def find_cris_person(context, result):
+    # Get Person from CRIS using primary e-mail, input e-mail or ORCID (in that order)
+    # The local person snapshot (see create-dmp sync-cris-persons) is tried first, CRIS is only asked on a miss
+    lookups = [(result['owner_email'], 'EMAIL'), (result['input_email'], 'EMAIL')]
+    if result['orcid'] != '':
+        lookups.append((result['orcid'], 'ORCID'))
+    snapshot = context['cris_persons_db']
+    if snapshot:
+        for id_value, id_type in lookups:
+            person_cris_id = cris_persons.find_person(snapshot, id_value, id_type)
+            if person_cris_id:
+                print('Got CRIS person from snapshot!')
+                return person_cris_id
+    for id_value, id_type in lookups:
+        person_get_url = os.getenv("CRIS_PERSON_URL") + '/Persons?idValue=' + id_value + '&idTypeValue=' + id_type
+        person_response = utils.http_request('cris', 'GET', person_get_url, hedge=True, headers={'Accept': 'application/json'})
+        person_response.raise_for_status()
+        person_crisdata = person_response.json()
+        if person_crisdata['TotalCount'] > 0:
+            person_cris_id = str(person_crisdata['Persons'][0]['Id'])
+            if snapshot:
+                cris_persons.store_person_id(snapshot, id_type, id_value, person_cris_id)
+                snapshot.commit()
+            return person_cris_id
+        print("Person with " + id_type.lower() + " " + id_value + " not found in CRIS...")
+    return None
+
+
+def find_cris_org_home(context, person_cris_id):
+    # Current org home of the person for CRIS_YEAR, from the snapshot or from CRIS (stored in the snapshot)
+    snapshot = context['cris_persons_db']
+    if snapshot:
+        organization_id = cris_persons.get_org_home(snapshot, person_cris_id, os.getenv("CRIS_YEAR"))
+        if organization_id:
+            return organization_id
+    organization_id = cris_persons.fetch_org_home(person_cris_id, os.getenv("CRIS_YEAR"))
+    if snapshot:
+        cris_persons.store_org_home(snapshot, person_cris_id, os.getenv("CRIS_YEAR"), organization_id)
+        snapshot.commit()
+    return organization_id
+
+
+def create_cris_project(context, result, project):
+    # Create Project in Chalmers CRIS
+    # Issue alert(s) to create project manually in case no person is found or something else fails
+    projectid = result['projectid']
+    cris_funder_id = context['cris_funder_id']
+
+    # Check if Project already exists
+    cris_check_url = os.getenv("CRIS_API_URL") + '/ProjectSearch?query="' + projectid + '"+AND+"' + cris_funder_id + '"'
+    check_response = utils.http_request('cris', 'GET', cris_check_url, hedge=True, headers={'Accept': 'application/json'})
+    check_response.raise_for_status()
+    checkdata = check_response.json()
+    if checkdata['TotalCount'] == 1:
+        add_issue(context, result, "Project " + projectid + " already exists in CRIS. Add DMP to project " + projectid + " manually!")
+        return
+
+    print("A new CRIS project record will be created for project " + projectid)
+    # Create CRIS Project object
+    current_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+    contract_org = dict(Id=cris_funder_id)
+    contract_id = dict(ProjectContractIdentifierID=2, ProjectContractIdentifierValue=projectid)
+    contract = dict(ContractSource='dsw', ContractStartDate=project['start'][0:10] + 'T00:00:00',
+                    ContractEndDate=project['end'][0:10] + 'T00:00:00', DmpValue=result['dmp_url'], DmpVersion=1,
+                    ContractOrganization=contract_org, OrganizationID=cris_funder_id,
+                    ContractIdentifiers=[contract_id], CreatedDate=current_date, CreatedBy='dsw')
+
+    person_cris_id = find_cris_person(context, result)
+    if person_cris_id is None:
+        add_issue(context, result, 'No Person with e-mail ' + result['owner_email'] + ' or ORCID ' + result['orcid'] + ' found in CRIS. Add project ' + projectid + ' manually!')
+        return
+
+    # Get Person current Org home from CRIS
+    try:
+        person_org_cris_id = find_cris_org_home(context, person_cris_id)
+        person_org = dict(OrganizationID=person_org_cris_id)
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        add_issue(context, result, 'Person org lookup failed. Add project ' + projectid + ' manually!')
+        return
+
+    person = dict(PersonID=person_cris_id, PersonOrganizations=[person_org], PersonRoleID=1)
+
+    cris_project = dict(
+        ProjectTitleEng=project['title'], ProjectTitleSwe=project['title_swe'],
+        ProjectDescriptionEng=project['desc'],
+        ProjectDescriptionEngHtml='<p>' + project['desc'] + '</p>', PublishStatus=1,
+        ProjectDescriptionSwe=project['desc_swe'],
+        ProjectDescriptionSweHtml='<p>' + project['desc_swe'] + '</p>',
+        StartDate=project['start'][0:10] + 'T00:00:00',
+        EndDate=project['end'][0:10] + 'T00:00:00', ProjectSource='SweCRIS', CreatedDate=current_date,
+        CreatedBy='dsw',
+        Contracts=[contract], Persons=[person]
+    )
+
+    # Add Project to CRIS
+    create_project_url = os.getenv("CRIS_API_URL") + '/Projects'
+    try:
+        project_create = utils.http_request('cris', 'POST', create_project_url, json=cris_project, headers={'Accept': 'application/json'})
+        project_create.raise_for_status()
+        project_cris_id = project_create.json()['ID']
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        add_issue(context, result, 'Could NOT create Project with name: ' + project['title'] + ' in CRIS. Add ' + projectid + ' manually!')
+        return
+    result['cris_project_id'] = project_cris_id
+    result['cris_project_url'] = os.getenv("CRIS_URL") + '/en/project/' + str(project_cris_id)
+    print('Project ' + projectid + ' created with id: ' + str(project_cris_id))
+
+
+def send_email(context, result):
+    # Create and send email if all is fine (and we have selected to do do)
+    try:
+        utils.send_html_email(result['owner_email'], result['name'], email_subject, context['email_template'],
+                              result['projectid'], result['title'], result['dmp_url'], result['cris_project_url'])
+        result['email_sent'] = True
+    except Exception as e:
+        add_issue(context, result, f"ERROR: Failed to send email to {result['owner_email']}: {e}")
+
+
+# Reply paths of the grant fields in the DMP, see build_dmp_content()
+dsw_field_paths = dict(title='project.name.path', desc='project.desc.path', start='project.start.path',
+                       end='project.end.path', grant_id='grant.id.path', funder='funder.path')
+
+
+def find_cris_project(context, projectid):
+    # CRIS project of a grant (same search as when it was created), None if there is none
+    cris_check_url = os.getenv("CRIS_API_URL") + '/ProjectSearch?query="' + projectid + '"+AND+"' + context['cris_funder_id'] + '"'
+    check_response = utils.http_request('cris', 'GET', cris_check_url, hedge=True, headers={'Accept': 'application/json'})
+    check_response.raise_for_status()
+    projects = check_response.json().get('Projects') or []
+    return projects[0] if projects else None
+
+
+def get_cris_project(context, cris_project_id):
+    # The full CRIS project record, search hits are not complete enough to be saved back
+    cris_response = utils.http_request('cris', 'GET', os.getenv("CRIS_API_URL") + '/Projects/' + str(cris_project_id),
+                                       hedge=True, headers={'Accept': 'application/json'})
+    cris_response.raise_for_status()
+    return cris_response.json()
+
+
+def dmp_uuid_from_cris(cris_project):
+    # The DMP linked from a CRIS project (DmpValue of a contract), None if it has no DSW link
+    dmp_prefix = os.getenv("DSW_UI_URL") + '/projects/'
+    for contract in cris_project.get('Contracts') or []:
+        if (contract.get('DmpValue') or '').startswith(dmp_prefix):
+            return contract['DmpValue'][len(dmp_prefix):].strip('/')
+    return None
+
+
+def find_dmp_in_dsw(context, result, titles):
+    """
+    DMP whose grant id reply is the project id, among the DMPs named after one of titles.
+    DSW only searches project names, so titles should hold the title the DMP was created with
+    (the one in CRIS) as well as the current one from the funder.
+    """
+    checked = set()
+    for title in dict.fromkeys(t for t in titles if t):
+        for candidate in dsw.find_projects(context['dsw_session'], context['dswurl'], title):
+            if candidate['uuid'] in checked:
+                continue
+            checked.add(candidate['uuid'])
+            replies = dsw.project_replies(context['dsw_session'], context['dswurl'], candidate['uuid'])
+            if dsw.reply_value(replies, config.get('Paths', 'grant.id.path')) == result['projectid']:
+                return candidate['uuid'], replies
+    return None, None
+
+
+def dsw_reply_hashes(replies):
+    return dmp_index.field_hashes({field: dsw.reply_value(replies, config.get('Paths', key)) for field, key in dsw_field_paths.items()})
+
+
+def cris_project_hashes(cris_project):
+    return dmp_index.field_hashes(dict(title=cris_project.get('ProjectTitleEng'), title_swe=cris_project.get('ProjectTitleSwe'),
+                                       desc=cris_project.get('ProjectDescriptionEng'), desc_swe=cris_project.get('ProjectDescriptionSwe'),
+                                       start=(cris_project.get('StartDate') or '')[0:10], end=(cris_project.get('EndDate') or '')[0:10]))
+
+
+def update_dmp(context, result, project, changed):
+    # Only the SetReplyEvents of the changed fields are sent, other replies (and edits by the owner) are left alone
+    paths = {config.get('Paths', dsw_field_paths[field]) for field in changed}
+    events = [event for event in build_dmp_content(context, result, project)['events'] if event.get('path') in paths]
+    dsw.update_project_content(context['dsw_session'], context['dswurl'], result['dmp_uuid'], events)
+    print('DMP ' + result['dmp_uuid'] + ' updated: ' + ', '.join(changed))
+
+
+def update_cris_project(context, result, project, cris_project, changed):
+    # Sets the changed fields on the CRIS project record (as read with get_cris_project) and saves it, the rest is sent back as read
+    if 'title' in changed:
+        cris_project['ProjectTitleEng'] = project['title']
+    if 'title_swe' in changed:
+        cris_project['ProjectTitleSwe'] = project['title_swe']
+    if 'desc' in changed:
+        cris_project['ProjectDescriptionEng'] = project['desc']
+        cris_project['ProjectDescriptionEngHtml'] = '<p>' + project['desc'] + '</p>'
+    if 'desc_swe' in changed:
+        cris_project['ProjectDescriptionSwe'] = project['desc_swe']
+        cris_project['ProjectDescriptionSweHtml'] = '<p>' + project['desc_swe'] + '</p>'
+    dsw_contracts = [c for c in cris_project.get('Contracts') or [] if c.get('DmpValue') == result['dmp_url']]
+    if 'start' in changed:
+        cris_project['StartDate'] = project['start'][0:10] + 'T00:00:00'
+        for contract in dsw_contracts:
+            contract['ContractStartDate'] = project['start'][0:10] + 'T00:00:00'
+    if 'end' in changed:
+        cris_project['EndDate'] = project['end'][0:10] + 'T00:00:00'
+        for contract in dsw_contracts:
+            contract['ContractEndDate'] = project['end'][0:10] + 'T00:00:00'
+    update_url = os.getenv("CRIS_API_URL") + '/Projects/' + str(result['cris_project_id'])
+    update_response = utils.http_request('cris', 'PUT', update_url, json=cris_project, headers={'Accept': 'application/json'})
+    update_response.raise_for_status()
+    print('CRIS project ' + str(result['cris_project_id']) + ' updated: ' + ', '.join(changed))
+
+
+def sync_existing(context, result, project, hashes, entry):
+    """
+    Brings an existing DMP (and CRIS project) in line with changed grant metadata.
+    With an index entry the changed fields are found from the stored hashes, without reading DSW or CRIS.
+    Otherwise the DMP is looked up through the CRIS project (DMP link) or in DSW, and its current replies are compared.
+    Returns True if the DMP was found.
+    """
+    cris_project = None
+    if entry:
+        result['dmp_uuid'] = entry['dmp_uuid']
+        result['cris_project_id'] = entry['cris_project_id'] or 0
+        dsw_hashes = dmp_index.target_hashes(entry, 'dsw')
+        cris_hashes = dmp_index.target_hashes(entry, 'cris')
+    else:
+        cris_project = find_cris_project(context, result['projectid'])
+        if cris_project:
+            result['cris_project_id'] = str(cris_project.get('ID') or cris_project.get('Id'))
+            cris_project = get_cris_project(context, result['cris_project_id'])
+            result['dmp_uuid'] = dmp_uuid_from_cris(cris_project)
+        if result['dmp_uuid']:
+            replies = dsw.project_replies(context['dsw_session'], context['dswurl'], result['dmp_uuid'])
+        else:
+            # The DMP has the title it was created with, which is still in CRIS if the funder has corrected it since
+            titles = [cris_project.get('ProjectTitleEng') if cris_project else None, project['title']]
+            result['dmp_uuid'], replies = find_dmp_in_dsw(context, result, titles)
+        if not result['dmp_uuid']:
+            add_issue(context, result, 'No existing DMP found for project id: ' + result['projectid'] + ' (by CRIS link or by title in DSW), nothing was updated. Check DSW manually, if there is no DMP run the project without --update to create it.')
+            return False
+        dsw_hashes = dsw_reply_hashes(replies)
+        cris_hashes = cris_project_hashes(cris_project) if cris_project else dict()
+    result['dmp_url'] = os.getenv("DSW_UI_URL") + '/projects/' + result['dmp_uuid']
+    if result['cris_project_id']:
+        result['cris_project_url'] = os.getenv("CRIS_URL") + '/en/project/' + str(result['cris_project_id'])
+
+    changed = dmp_index.changed_fields(dmp_index.dsw_fields, dsw_hashes, hashes)
+    if changed:
+        tracing.stage('dsw-update')
+        try:
+            update_dmp(context, result, project, changed)
+            result['updated_fields'].extend('dsw:' + field for field in changed)
+        except backends.CircuitOpenError as e:
+            defer(context, result, e.backend)
+            return True
+        except requests.exceptions.RequestException as e:
+            if backends.is_unavailable(e):
+                defer(context, result, 'dsw', e)
+                return True
+            error = e.response.text if e.response is not None else str(e)
+            add_issue(context, result, 'ERROR: Could not update DMP ' + result['dmp_uuid'] + ' for project id: ' + result['projectid'] + '. ' + error)
+            return True
+
+    changed = dmp_index.changed_fields(dmp_index.cris_fields, cris_hashes, hashes)
+    if not result['cris_project_id']:
+        # No CRIS project to keep up to date
+        cris_hashes = hashes
+    elif changed and not context['options']['update_cris']:
+        print('CRIS project ' + str(result['cris_project_id']) + ' not updated (-u n): ' + ', '.join(changed))
+    elif changed:
+        tracing.stage('cris-update')
+        try:
+            if cris_project is None:
+                cris_project = get_cris_project(context, result['cris_project_id'])
+            update_cris_project(context, result, project, cris_project, changed)
+            result['updated_fields'].extend('cris:' + field for field in changed)
+            cris_hashes = hashes
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            add_issue(context, result, 'CRIS project ' + str(result['cris_project_id']) + ' could not be updated (' + repr(e) + '). Update project ' + result['projectid'] + ' manually!')
+    else:
+        cris_hashes = hashes
+
+    # The DSW part is up to date here, the CRIS part keeps its old hashes if CRIS was not updated (-u n or a failure),
+    # so a later run still sees those fields as changed
+    dmp_index.store_entry(context['dmp_index_db'], context['funder_name'], result['projectid'], result['dmp_uuid'],
+                          result['cris_project_id'], dmp_index.entry_hashes(hashes, cris_hashes))
+    return True
+
+
+def update_project(context, record):
+    # --update: sync changed grant metadata into the existing DMP and CRIS project of a grant, nothing is created
+    result = new_result(record, dict(primary_email=record['email'], orcid=''))
+    started = time.perf_counter()
+    with tracing.span('project', project_id=result['projectid'], update=True):
+        print('Updating project ' + result['projectid'])
+        if backends.is_open('dsw'):
+            defer(context, result, 'dsw')
+        else:
+            tracing.stage('project-data', source=context['source'])
+            project = fetch_project_data(context, result)
+            if project:
+                result['title'] = project['title']
+                hashes = dmp_index.field_hashes(dmp_index.mapped_fields(context, result['projectid'], project))
+                entry = dmp_index.get_entry(context['dmp_index_db'], context['funder_name'], result['projectid'])
+                if entry and entry['content_hash'] == dmp_index.content_hash(dmp_index.entry_hashes(hashes, hashes)):
+                    # Nothing changed since the last run, no DSW or CRIS calls at all
+                    result['dmp_uuid'] = entry['dmp_uuid']
+                    result['dmp_url'] = os.getenv("DSW_UI_URL") + '/projects/' + entry['dmp_uuid']
+                    result['cris_project_id'] = entry['cris_project_id'] or 0
+                    print('No changes.')
+                else:
+                    try:
+                        found = sync_existing(context, result, project, hashes, entry)
+                    except backends.CircuitOpenError as e:
+                        defer(context, result, e.backend)
+                        found = False
+                    except requests.exceptions.RequestException as e:
+                        if backends.is_unavailable(e):
+                            defer(context, result, 'DSW/CRIS', e)
+                        else:
+                            add_issue(context, result, 'ERROR: Lookup of the existing DMP for project id: ' + result['projectid'] + ' failed (' + repr(e) + '). This project will need to be handled manually!')
+                        found = False
+                    except (ValueError, KeyError) as e:
+                        add_issue(context, result, 'ERROR: Lookup of the existing DMP for project id: ' + result['projectid'] + ' failed (' + repr(e) + '). This project will need to be handled manually!')
+                        found = False
+                    if found and result['status'] != 'deferred':
+                        log_result(context, result)
+    if result['dmp_uuid'] and result['status'] != 'deferred':
+        if result['issues']:
+            result['status'] = 'updated_with_issues'
+        else:
+            result['status'] = 'updated' if result['updated_fields'] else 'unchanged'
+    result['duration'] = round(time.perf_counter() - started, 3)
+    print('\n')
+    return result
+
+
+def process_project(context, record, owner):
+    result = new_result(record, owner)
+    started = time.perf_counter()
+    with tracing.span('project', project_id=result['projectid']):
+        print('Processing project ' + result['projectid'])
+        print(result['name'])
+
+        # Only create DMPs for owners that are ready in DSW, and only while DSW is responding
+        if owner.get('pdb_unavailable'):
+            defer(context, result, 'pdb')
+        elif backends.is_open('dsw'):
+            defer(context, result, 'dsw')
+        elif result['owner_email'] in context['dsw_unavailable']:
+            # The owner could not be provisioned because DSW did not respond, not because of the user data
+            defer(context, result, 'dsw')
+        elif result['owner_email'] not in context['dsw_ready']:
+            add_issue(context, result, 'User ' + result['owner_email'] + ' is not available in DSW, project id: ' + result['projectid'] + ' was skipped. This project will need to be handled manually!')
+        else:
+            result['owner_uuid'] = context['dsw_ready'][result['owner_email']]
+            tracing.stage('project-data', source=context['source'])
+            project = fetch_project_data(context, result)
+            if project:
+                result['title'] = project['title']
+                tracing.stage('dsw-dmp')
+                if create_dmp(context, result, project):
+                    if context['options']['update_cris']:
+                        tracing.stage('cris')
+                        try:
+                            create_cris_project(context, result, project)
+                        except backends.CircuitOpenError:
+                            add_issue(context, result, 'CRIS is unavailable, no CRIS project record was created. Add project ' + result['projectid'] + ' manually!')
+                        except (requests.exceptions.RequestException, ValueError, KeyError, IndexError) as e:
+                            add_issue(context, result, 'CRIS lookup failed (' + repr(e) + '). Add project ' + result['projectid'] + ' manually!')
+                    if context['options']['send_emails']:
+                        tracing.stage('email')
+                        send_email(context, result)
+                    # Print output to logfile
+                    log_result(context, result)
+                    # Hashes of the grant fields, so later --update runs can skip this project while they are unchanged
+                    hashes = dmp_index.field_hashes(dmp_index.mapped_fields(context, result['projectid'], project))
+                    dmp_index.store_entry(context['dmp_index_db'], context['funder_name'], result['projectid'], result['dmp_uuid'],
+                                          result['cris_project_id'], dmp_index.entry_hashes(hashes, hashes))
+    if result['dmp_uuid']:
+        result['status'] = 'created_with_issues' if result['issues'] else 'created'
+    result['duration'] = round(time.perf_counter() - started, 3)
+    print('\n')
+    return result
+
+
+def run(records, funder, options=None):
+    """
+    Creates DMPs in DSW (and project records in CRIS) for a batch of granted projects.
+    With options['update'] the existing DMPs and CRIS projects are updated instead (see update_project()).
+    records: list of dicts with projectid, name (inverted, e.g. 'Einstein Albert') and email, see read_records()
+    funder: funder name, one of the keys in funders (formas, vr)
+    options: overrides for default_options
+    Returns a summary dict with counts and one result dict per record (see new_result()).
+    Raises PipelineError if the run cannot start.
+    """
+    options = dict(default_options, **(options or {}))
+    funder_name = funder.lower().strip()
+    if funder_name not in funders:
+        raise PipelineError('Funder has to be one of ' + ', '.join('"' + f + '"' for f in funders))
+    context = dict(funders[funder_name], funder_name=funder_name, options=options, dswurl=os.getenv("DSW_URL"))
+    summary = dict(funder=funder_name, update=options['update'], started=datetime.now().isoformat(timespec='seconds'), results=[])
+    started = time.perf_counter()
+    backends.reset()
+
+    with tracing.span('run', funder=funder_name, records=len(records)):
+        # PDB session and DSW token, reused from earlier runs if still valid (updates do not need PDB)
+        context['pdb_session_token'] = None
+        if not options['update']:
+            try:
+                context['pdb_session_token'] = sessions.pdb_session(options['session_cache'])
+            except (RuntimeError, requests.exceptions.RequestException) as e:
+                raise PipelineError('Could not start a PDB session: ' + str(e))
+        context['gdp_mirror_db'] = None
+        context['cris_persons_db'] = None
+        context['dsw_session'] = None
+        context['http_cache'] = None
+        context['dmp_index_db'] = None
+        try:
+            try:
+                # Keep-alive session for all DSW calls, saves a connection setup per request
+                context['dsw_session'] = sessions.dsw_session(options['session_cache'])
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                write_log(context, 'ERROR: Could not authenticate with DSW, user: ' + str(os.getenv("DSW_USER")) + ', exiting: ' + str(e))
+                raise PipelineError('Could not authenticate with DSW, user: ' + str(os.getenv("DSW_USER")))
+
+            # Use the local GDP mirror (see create-dmp sync-gdp) if one exists, live GDP lookups are only made on a miss
+            # Updates always ask GDP (conditional GETs through the http cache), a mirror that is not synced would hide corrections
+            if context['source'] == 'gdp' and not options['update']:
+                context['gdp_mirror_db'] = gdp_mirror.open_existing_mirror()
+            # Same for the CRIS person snapshot (see create-dmp sync-cris-persons)
+            if options['update_cris']:
+                context['cris_persons_db'] = cris_persons.open_existing_snapshot()
+            if options['http_cache']:
+                context['http_cache'] = httpcache.open_cache()
+            context['dmp_index_db'] = dmp_index.open_index()
+
+            if options['update']:
+                # Owners are not looked up or provisioned, the DMPs already exist
+                summary['users_created'] = []
+                summary['users_failed'] = dict()
+                for record in records:
+                    summary['results'].append(update_project(context, record))
+            else:
+                owners = resolve_owners(context, records)
+                context['dsw_ready'], dsw_created, dsw_failed = provision_owners(context, records, owners)
+                summary['users_created'] = dsw_created
+                summary['users_failed'] = dsw_failed
+
+                for record, owner in zip(records, owners):
+                    summary['results'].append(process_project(context, record, owner))
+        finally:
+            if context['pdb_session_token']:
+                sessions.release_pdb_session(context['pdb_session_token'], options['session_cache'])
+            if context['dmp_index_db']:
+                context['dmp_index_db'].close()
+            if context['gdp_mirror_db']:
+                context['gdp_mirror_db'].close()
+            if context['cris_persons_db']:
+                context['cris_persons_db'].close()
+            if context['dsw_session']:
+                context['dsw_session'].close()
+            if context['http_cache']:
+                summary['http_cache'] = context['http_cache']['stats']
+                httpcache.close_cache(context['http_cache'])
+
+    summary['finished'] = datetime.now().isoformat(timespec='seconds')
+    summary['duration'] = round(time.perf_counter() - started, 3)
+    summary['processed'] = sum(1 for r in summary['results'] if r['dmp_uuid'])
+    summary['deferred'] = sum(1 for r in summary['results'] if r['status'] == 'deferred')
+    if options['update']:
+        summary['updated'] = sum(1 for r in summary['results'] if r['status'] in ('updated', 'updated_with_issues'))
+        summary['unchanged'] = sum(1 for r in summary['results'] if r['status'] == 'unchanged')
+    summary['backends'] = backends.status()
+    summary['issues'] = sum(len(r['issues']) for r in summary['results']) + len(summary.get('users_failed', {}))
+    return summary
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import stat
+import base64
+import tempfile
+import threading
+import configparser
+import requests
+from . import utils
+
+## Cache for the DSW token (JWT) and the PDB session, so short back-to-back runs can skip the logins
+## Stored in SESSION_CACHE_PATH (default ~/.create-dmp-sessions.json), readable by the owner only
+## A DSW call answered with 401 logs in again and is resent, `create-dmp logout` ends the cached PDB session
+
+config = configparser.ConfigParser()
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create-new-dmp.conf')
+with open(config_path) as f:
+    config.read_file(f)
+
+_lock = threading.Lock()
+_warned = set()
+
+
+def default_cache_path():
+    return os.getenv("SESSION_CACHE_PATH") or os.path.join(os.path.expanduser('~'), '.create-dmp-sessions.json')
+
+
+def read_cache(path=None):
+    path = path or default_cache_path()
+    try:
+        mode = os.stat(path).st_mode
+        if mode & (stat.S_IRWXG | stat.S_IRWXO):
+            if path not in _warned:
+                _warned.add(path)
+                print('\033[91m!!!\033[0m Session cache ' + path + ' can be read by other users, it is not used (and will be replaced).')
+            return dict()
+        with open(path, encoding='utf-8') as cf:
+            return json.load(cf)
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_cache(cache, path=None):
+    # Written to a new file that only the owner can read, then moved in place
+    # The file name is unique per write, so runs side by side (shards) do not move each other's files
+    path = path or default_cache_path()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as cf:
+            json.dump(cache, cf)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _cached(key):
+    entry = read_cache().get(key)
+    if entry and entry['expires'] > time.time():
+        return entry['token']
+    return None
+
+
+def _store(key, token, expires):
+    # A cache that cannot be written (e.g. read-only home directory) only costs a login in the next run
+    with _lock:
+        cache = read_cache()
+        # Drop expired entries while at it
+        cache = {k: v for k, v in cache.items() if v['expires'] > time.time()}
+        if token:
+            cache[key] = dict(token=token, expires=expires)
+        else:
+            cache.pop(key, None)
+        try:
+            write_cache(cache)
+        except OSError as e:
+            print('\033[91m!!!\033[0m Session cache ' + default_cache_path() + ' could not be written, tokens are not kept for the next run: ' + str(e))
+
+
+def jwt_expiry(token):
+    # exp claim of a JWT, the signature is not checked (DSW does that)
+    try:
+        payload = token.split('.')[1]
+        return float(json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['exp'])
+    except (IndexError, ValueError, KeyError, TypeError):
+        return 0
+
+
+def dsw_login():
+    # DSW authentication, returns the JWT
+    dsw_authurl = os.getenv("DSW_URL") + '/tokens'
+    auth_data = dict(email=os.getenv("DSW_USER"), password=os.getenv("DSW_PW"))
+    auth_response = utils.http_request('dsw', 'POST', dsw_authurl, json=auth_data, headers={'Accept': 'application/json'})
+    auth_response.raise_for_status()
+    return auth_response.json()['token']
+
+
+def dsw_token(use_cache=True, force_login=False):
+    """
+    DSW token from the cache if it is valid for a while longer, otherwise from a new login (stored in the cache).
+    Tokens without an exp claim are cached for dsw.ttl seconds.
+    """
+    key = 'dsw ' + os.getenv("DSW_URL") + ' ' + str(os.getenv("DSW_USER"))
+    if use_cache and not force_login:
+        token = _cached(key)
+        if token:
+            print('✓ Using cached DSW token.')
+            return token
+    token = dsw_login()
+    if use_cache:
+        margin = config.getfloat('Sessions', 'dsw.margin', fallback=300)
+        expires = (jwt_expiry(token) or time.time() + config.getfloat('Sessions', 'dsw.ttl', fallback=3600)) - margin
+        _store(key, token, expires)
+    return token
+
+
+def dsw_session(use_cache=True):
+    """
+    Keep-alive session for the DSW API with the token in its headers.
+    A 401 answer (token expired or revoked) gives a new login, the request is then sent again with the new token.
+    """
+    session = requests.Session()
+    session.headers.update({'Accept': 'application/json',
+                            'Authorization': 'Bearer ' + dsw_token(use_cache)})
+    relogin_lock = threading.Lock()
+
+    def reauthenticate(response, *args, **kwargs):
+        if response.status_code != 401 or getattr(response.request, 'reauthenticated', False):
+            return response
+        with relogin_lock:
+            # Another thread may already have logged in again
+            if session.headers['Authorization'] == response.request.headers.get('Authorization'):
+                print('DSW token was not accepted, logging in again...')
+                session.headers['Authorization'] = 'Bearer ' + dsw_token(use_cache, force_login=True)
+        request = response.request.copy()
+        request.headers['Authorization'] = session.headers['Authorization']
+        request.reauthenticated = True
+        return session.send(request, **kwargs)
+
+    session.hooks['response'].append(reauthenticate)
+    return session
+
+
+def pdb_key():
+    return 'pdb ' + str(utils.pdb_url) + ' ' + str(utils.pdb_user)
+
+
+def pdb_session(use_cache=True, force_login=False):
+    # PDB session token, from the cache or from a new session start and login
+    if use_cache and not force_login:
+        token = _cached(pdb_key())
+        if token:
+            print('✓ Using cached PDB session.')
+            return token
+    token = utils.pdb_start_session()
+    try:
+        utils.pdb_login(token)
+    except (RuntimeError, requests.exceptions.RequestException):
+        utils.pdb_stop_session(token)
+        raise
+    return token
+
+
+def release_pdb_session(token, use_cache=True):
+    """
+    Called when a run ends: the PDB session is kept for pdb.ttl seconds (PDB ends idle sessions itself)
+    if the cache is used, otherwise it is stopped.
+    """
+    if use_cache:
+        _store(pdb_key(), token, time.time() + config.getfloat('Sessions', 'pdb.ttl', fallback=1800))
+    else:
+        utils.pdb_stop_session(token)
+
+
+def logout():
+    # create-dmp logout: stop the cached PDB session and remove the cached tokens
+    token = _cached(pdb_key())
+    if token:
+        utils.pdb_stop_session(token)
+    try:
+        os.remove(default_cache_path())
+        print('✓ Session cache ' + default_cache_path() + ' removed.')
+    except FileNotFoundError:
+        print('No session cache found.')
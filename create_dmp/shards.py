@@ -0,0 +1,179 @@
+import os
+import csv
+import json
+import re
+import hashlib
+from datetime import datetime
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from . import pipeline
+
+## Sharded runs for very large batches: split an input file into N shards that run as separate create-dmp
+## processes (e.g. on different hosts), then merge the per-shard results and logs into one report
+##     create-dmp shard -i formas_251030.txt -n 4
+##     create-dmp -i formas_251030.txt -f formas --shard 1/4     (or -i formas_251030_shard1of4.txt)
+##     create-dmp merge formas_shard1of4_*.json formas_shard2of4_*.json ...
+
+
+def shard_of(email, count):
+    # Shard index (0-based) for a row, keyed on the PI e-mail so all grants of a PI (and the DSW user) are in the same shard
+    # This is the e-mail in the input file: DSW users are keyed on the PDB primary e-mail, which is only known during the run,
+    # so a PI listed with two different aliases can still end up in two shards that both try to create the same DSW user
+    # sha1 and not hash(), the result has to be the same on every host and Python version
+    digest = hashlib.sha1(email.strip().lower().encode('utf-8')).hexdigest()
+    return int(digest, 16) % count
+
+
+def parse_shard(spec):
+    # '2/4' -> (2, 4), shards are numbered from 1
+    try:
+        number, count = (int(v) for v in spec.split('/'))
+    except ValueError:
+        raise ValueError('Shard has to be given as k/N, e.g. 2/4')
+    if count < 1 or not 1 <= number <= count:
+        raise ValueError('Shard ' + spec + ' is out of range, k has to be between 1 and N')
+    return number, count
+
+
+def shard_from_filename(path):
+    # Shard files written by shard_command are named <infile>_shard<k>of<N>.txt, returns (k, N) or None
+    match = re.search(r'_shard(\d+)of(\d+)\.[^.]*$', os.path.basename(path))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def in_shard(record, number, count):
+    return shard_of(record['email'], count) == number - 1
+
+
+def shard_command(argv=None):
+    parser = ArgumentParser(prog='create-dmp shard',
+                            description='Split an input file into N shards, all rows of a PI (e-mail) end up in the same shard.',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-i', '--infile', help='Input file, tab-delimited, with columns: ProjectID, Name (inverted), Email', required=True)
+    parser.add_argument('-n', '--shards', help='Number of shards', type=int, required=True)
+    parser.add_argument('-o', '--outdir', help='Directory for the shard files, defaults to the directory of the input file')
+    args = parser.parse_args(argv)
+
+    if args.shards < 1:
+        parser.error('number of shards has to be at least 1')
+    with open(args.infile, encoding='utf-8') as infile_txt:
+        rows = [row for row in csv.reader(infile_txt, delimiter='\t') if row]
+    shards = [[] for _ in range(args.shards)]
+    for row in rows:
+        shards[shard_of(row[2], args.shards)].append(row)
+
+    outdir = args.outdir or os.path.dirname(args.infile)
+    base, ext = os.path.splitext(os.path.basename(args.infile))
+    for index, shard_rows in enumerate(shards):
+        shard_file = os.path.join(outdir, base + '_shard' + str(index + 1) + 'of' + str(args.shards) + (ext or '.txt'))
+        with open(shard_file, 'w', encoding='utf-8', newline='\n') as sf:
+            for row in shard_rows:
+                sf.write('\t'.join(row) + '\n')
+        print('✓ ' + shard_file + ': ' + str(len(shard_rows)) + ' project(s), ' + str(len({row[2].strip().lower() for row in shard_rows})) + ' PI(s)')
+
+
+def merge(summaries):
+    """
+    Combines the results of sharded runs (the .json files written by create-dmp) into one summary with global counts.
+    Checks that every shard is there once and that no project was processed by more than one shard.
+    Update runs (--update) are merged with update runs only, their updated/unchanged counts are added up.
+    """
+    merged = dict(funder=None, update=None, shards=[], missing_shards=[], duplicate_projects=[], foreign_projects=[],
+                  started=None, finished=None, duration=0, processed=0, deferred=0, issues=0,
+                  users_created=[], users_failed=dict(), backends=dict(), results=[])
+    counts = set()
+    seen = dict()
+    for summary in summaries:
+        shard = summary.get('shard')
+        merged['shards'].append(shard)
+        if merged['funder'] and summary['funder'] != merged['funder']:
+            raise ValueError('Results are for different funders: ' + merged['funder'] + ', ' + summary['funder'])
+        merged['funder'] = summary['funder']
+        if merged['update'] is not None and bool(summary.get('update')) != merged['update']:
+            raise ValueError('Results of update runs (--update) and create runs can not be merged')
+        merged['update'] = bool(summary.get('update'))
+        if merged['update']:
+            for key in ['updated', 'unchanged']:
+                merged[key] = merged.get(key, 0) + summary.get(key, 0)
+        merged['started'] = min(filter(None, [merged['started'], summary['started']]))
+        merged['finished'] = max(filter(None, [merged['finished'], summary['finished']]))
+        # Shards run side by side, the slowest one decides how long the batch took
+        merged['duration'] = max(merged['duration'], summary['duration'])
+        for key in ['processed', 'deferred', 'issues']:
+            merged[key] += summary.get(key, 0)
+        merged['users_created'].extend(summary.get('users_created', []))
+        merged['users_failed'].update(summary.get('users_failed', {}))
+        for backend, state in summary.get('backends', {}).items():
+            total = merged['backends'].setdefault(backend, dict(times_opened=0, rejected_calls=0))
+            total['times_opened'] += state['times_opened']
+            total['rejected_calls'] += state['rejected_calls']
+
+        if shard:
+            number, count = parse_shard(shard)
+            counts.add(count)
+        for result in summary['results']:
+            result['shard'] = shard
+            if result['projectid'] in seen:
+                merged['duplicate_projects'].append(result['projectid'])
+            seen[result['projectid']] = shard
+            if shard and shard_of(result['input_email'], count) != number - 1:
+                merged['foreign_projects'].append(result['projectid'])
+            merged['results'].append(result)
+
+    if len(counts) > 1:
+        raise ValueError('Results are from different shardings: ' + ', '.join(str(s) for s in merged['shards']))
+    if counts:
+        count = counts.pop()
+        merged['missing_shards'] = [str(k) + '/' + str(count) for k in range(1, count + 1)
+                                    if str(k) + '/' + str(count) not in merged['shards']]
+    merged['results'].sort(key=lambda r: r['projectid'])
+    return merged
+
+
+def merge_command(argv=None):
+    parser = ArgumentParser(prog='create-dmp merge',
+                            description='Merge the results (.json) and logfiles of sharded create-dmp runs into one report.',
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('results', help='Results files (.json) of the shard runs, the logfiles are expected next to them', nargs='+')
+    parser.add_argument('-o', '--output', help='Name for the merged report, without extension. Defaults to <funder>_merged_<timestamp>')
+    args = parser.parse_args(argv)
+
+    summaries = []
+    for results_file in args.results:
+        with open(results_file, encoding='utf-8') as rf:
+            summaries.append(json.load(rf))
+    try:
+        merged = merge(summaries)
+    except ValueError as e:
+        print('\033[91m❌\033[0m ERROR: ' + str(e) + ', exiting!')
+        raise SystemExit(1)
+
+    output = args.output or merged['funder'] + '_merged_' + datetime.now().strftime("%Y%m%d_%H%M%S")
+    with open(output + '.json', 'w', encoding='utf-8') as mf:
+        json.dump(merged, mf, ensure_ascii=False, indent=2)
+    # One logfile, in shard order
+    with open(output + '.log', 'w', encoding='utf-8') as lf:
+        for results_file in args.results:
+            shard_log = results_file[:-len('.json')] + '.log'
+            if os.path.exists(shard_log):
+                with open(shard_log, encoding='utf-8') as sl:
+                    lf.write(sl.read())
+            else:
+                print('\033[91m!!!\033[0m Logfile ' + shard_log + ' not found, it is missing from the merged log.')
+    deferred = [r for r in merged['results'] if r['status'] == 'deferred']
+    if deferred:
+        pipeline.write_records(output + '_deferred.txt', deferred)
+
+    print('Merged ' + str(len(summaries)) + ' shard(s): ' + ', '.join(str(s) for s in merged['shards']))
+    if merged['missing_shards']:
+        print('\033[91m!!!\033[0m Results for shard(s) ' + ', '.join(merged['missing_shards']) + ' are missing!')
+    if merged['duplicate_projects']:
+        print('\033[91m!!!\033[0m Project(s) processed by more than one shard, check for duplicate DMPs: ' + ', '.join(merged['duplicate_projects']))
+    if merged['foreign_projects']:
+        print('\033[91m!!!\033[0m Project(s) processed by a shard they do not belong to: ' + ', '.join(merged['foreign_projects']))
+    if merged['update']:
+        print('Projects: ' + str(len(merged['results'])) + ', DMPs updated: ' + str(merged['updated']) + ', unchanged: ' + str(merged['unchanged']) +
+              ', deferred: ' + str(merged['deferred']) + ', issues: ' + str(merged['issues']) + ', batch time: ' + str(merged['duration']) + ' s')
+    else:
+        print('Projects: ' + str(len(merged['results'])) + ', DMPs created: ' + str(merged['processed']) + ', deferred: ' + str(merged['deferred']) +
+              ', issues: ' + str(merged['issues']) + ', new DSW users: ' + str(len(merged['users_created'])) + ', batch time: ' + str(merged['duration']) + ' s')
+    print('Report written to ' + output + '.json and ' + output + '.log' + (' (deferred projects in ' + output + '_deferred.txt)' if deferred else ''))
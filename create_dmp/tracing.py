@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+
+## Hierarchical trace spans (run -> project -> stage -> HTTP call), exported in Chrome trace format
+## The file can be opened in chrome://tracing, https://ui.perfetto.dev or speedscope
+## Tracing is off unless enable() is called (create-dmp --trace), spans are then no-ops
+
+_enabled = False
+_finished = []
+_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def current():
+    # The innermost open span of this thread, pass it as parent to spans started in worker threads
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def start_span(name, parent=None, is_stage=False, **attributes):
+    if not _enabled:
+        return None
+    stack = _stack()
+    if parent is None and stack:
+        parent = stack[-1]
+    span = dict(name=name, id=next(_ids), parent_id=parent['id'] if parent else None, is_stage=is_stage,
+                start=time.time(), start_counter=time.perf_counter(), tid=threading.get_ident(), attributes=attributes)
+    stack.append(span)
+    return span
+
+
+def end_span(span):
+    # Ends the span and any spans still open inside it (e.g. the last stage of a project)
+    if span is None:
+        return
+    stack = _stack()
+    while stack:
+        open_span = stack.pop()
+        open_span['duration'] = time.perf_counter() - open_span['start_counter']
+        with _lock:
+            _finished.append(open_span)
+        if open_span is span:
+            break
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """
+    Context manager for a span, yields its attributes dict so status codes, sizes etc. can be added.
+    Exceptions passing through are recorded as an error attribute.
+    """
+    new_span = start_span(name, parent, **attributes)
+    try:
+        yield new_span['attributes'] if new_span else dict()
+    except BaseException as e:
+        if new_span:
+            new_span['attributes']['error'] = repr(e)
+        raise
+    finally:
+        end_span(new_span)
+
+
+def stage(name, **attributes):
+    # Marks the start of a stage within the current span, ending the previous stage if one is open
+    if not _enabled:
+        return None
+    stack = _stack()
+    if stack and stack[-1]['is_stage']:
+        end_span(stack[-1])
+    return start_span(name, is_stage=True, **attributes)
+
+
+def endpoint(url):
+    # URL without credentials and query string, safe to write to the trace file
+    scheme, _, rest = url.partition('://')
+    host, _, path = rest.partition('/')
+    host = host.rpartition('@')[2]
+    return scheme + '://' + host + '/' + path.split('?', 1)[0]
+
+
+def export(path):
+    """
+    Ends all spans still open in this thread and writes every finished span to path.
+    """
+    if not _enabled:
+        return
+    stack = _stack()
+    if stack:
+        end_span(stack[0])
+    pid = os.getpid()
+    with _lock:
+        spans = sorted(_finished, key=lambda s: s['start'])
+    events = []
+    for s in spans:
+        args = dict(s['attributes'], span_id=s['id'], parent_id=s['parent_id'])
+        events.append(dict(name=s['name'], cat=s['attributes'].get('backend', 'create-dmp'), ph='X',
+                           ts=round(s['start'] * 1000000), dur=round(s['duration'] * 1000000),
+                           pid=pid, tid=s['tid'], args=args))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f, ensure_ascii=False, default=str)
+    print('Trace with ' + str(len(events)) + ' spans written to ' + path)
@@ -5,6 +5,8 @@ import requests
 import json
 import os
 from dotenv import load_dotenv
+from . import tracing
+from . import backends
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(base_dir, '.env')
@@ -20,9 +22,40 @@ pdb_url = os.getenv("PDB_API_URL")
 pdb_user = os.getenv("PDB_USER")
 pdb_pw = os.getenv("PDB_PW")    
 
+class PDBSessionError(RuntimeError):
+    # The PDB session token was not accepted (expired or stopped), a new session is needed
+    pass
+
+def http_request(backend, method, url, session=None, hedge=False, **kwargs):
+    # All HTTP calls to backends go through here, each call is a trace span (see tracing.py)
+    # Calls get the backend's timeout and are rejected at once while its circuit breaker is open (see backends.py)
+    # hedge=True sends a duplicate if the answer is slow, only for idempotent lookups
+    kwargs.setdefault('timeout', backends.timeout(backend))
+    with tracing.span(method + ' ' + backend, backend=backend, method=method, endpoint=tracing.endpoint(url)) as span:
+        backends.before_call(backend)
+        send = lambda: (session or requests).request(method, url, **kwargs)
+        try:
+            if hedge:
+                response, span['hedged'] = backends.hedged(backend, send)
+            else:
+                response = send()
+        except requests.exceptions.RequestException as e:
+            if backends.is_failure(error=e):
+                backends.record_failure(backend)
+            else:
+                backends.record_success(backend)
+            raise
+        if backends.is_failure(response=response):
+            backends.record_failure(backend)
+        else:
+            backends.record_success(backend)
+        span['status_code'] = response.status_code
+        span['bytes'] = len(response.content)
+        return response
+
 def test_smtp_connection():
     try:
-        with smtplib.SMTP(smtp_server, timeout=10) as server:
+        with smtplib.SMTP(smtp_server, smtp_port, timeout=backends.timeout('smtp')) as server:
             server.starttls()
             server.login(smtp_user, smtp_password)
             return True
@@ -49,14 +82,12 @@ def send_html_email(recipient, recipent_name, subject, template_filename, projec
     msg['Cc'] = cc
     msg['Subject'] = subject
     msg.attach(MIMEText(html_content, 'html'))
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(email_sender, [recipient, cc], msg.as_string())
-            print("Email to " + recipient + " sent successfully.")
-    except Exception as e:
-        print(f"Failed to send email: {e}")
+    # SMTP errors are raised, the caller records them (see pipeline.send_email)
+    with tracing.span('SMTP send', backend='smtp', bytes=len(html_content)), smtplib.SMTP(smtp_server, smtp_port, timeout=backends.timeout('smtp')) as server:
+        server.starttls()
+        server.login(smtp_user, smtp_password)
+        server.sendmail(email_sender, [recipient, cc], msg.as_string())
+        print("Email to " + recipient + " sent successfully.")
 
 def pdb_start_session():
     pdbstart_payload = {
@@ -66,19 +97,17 @@ def pdb_start_session():
     pdb_headers = {
     "Content-Type": "application/json"
     }
-    pdbstart_response = requests.post(pdb_url, headers=pdb_headers, data=json.dumps(pdbstart_payload))
+    pdbstart_response = http_request('pdb', 'POST', pdb_url, headers=pdb_headers, data=json.dumps(pdbstart_payload))
     if pdbstart_response.status_code == 200:
         try:
             pdbstart_result = pdbstart_response.json()
             session_token = pdbstart_result['session']
             print("\u2713 PDB session started successfully.")
             return session_token
-        except ValueError:
-            print(pdbstart_response.text)
-            exit()
+        except (ValueError, KeyError):
+            raise RuntimeError(pdbstart_response.text)
     else:
-        print(f"PDB session start request failed with status code {pdbstart_response.status_code}")
-        exit()
+        raise RuntimeError(f"PDB session start request failed with status code {pdbstart_response.status_code}")
 
 def pdb_login(session_token):
     pdblogin_payload = {
@@ -90,17 +119,15 @@ def pdb_login(session_token):
     pdb_headers = {
     "Content-Type": "application/json"
     }
-    pdblogin_response = requests.post(pdb_url, headers=pdb_headers, data=json.dumps(pdblogin_payload))
+    pdblogin_response = http_request('pdb', 'POST', pdb_url, headers=pdb_headers, data=json.dumps(pdblogin_payload))
     if pdblogin_response.status_code == 200:
         try:
             pdblogin_result = pdblogin_response.json()
             print("\u2713 PDB login successful.")
         except ValueError:
-            print(pdblogin_response.text)
-            exit()
+            raise RuntimeError(pdblogin_response.text)
     else:
-        print(f"PDB login request failed with status code {pdblogin_response.status_code}")
-        exit()
+        raise RuntimeError(f"PDB login request failed with status code {pdblogin_response.status_code}")
     
 def pdb_stop_session(session_token):
     pdbstop_payload = {
@@ -112,17 +139,70 @@ def pdb_stop_session(session_token):
     pdb_headers = {
     "Content-Type": "application/json"
     }
-    pdbstop_response = requests.post(pdb_url, headers=pdb_headers, data=json.dumps(pdbstop_payload))
+    try:
+        pdbstop_response = http_request('pdb', 'POST', pdb_url, headers=pdb_headers, data=json.dumps(pdbstop_payload))
+    except requests.exceptions.RequestException as e:
+        print(f"PDB session terminate request failed: {e}")
+        return
     if pdbstop_response.status_code == 200:
         try:
             pdbstop_result = pdbstop_response.json()
             print("PDB session terminated successfully")
         except ValueError:
             print(pdbstop_response.text)
-            exit()
     else:
         print(f"PDB session terminate request failed with status code {pdbstop_response.status_code}")
-        exit()
+
+def pdb_person_lookup(session_token, email):
+    # Get primary email and ORCID from PDB, falls back to the given email if the person is not found
+    # Raises requests.exceptions.RequestException if PDB is unavailable (timeout, connection error, 5xx), as the
+    # input email may be an alias and must not be used in place of the primary one then
+    pdbperson_payload = {
+            "function": "person_dig",
+            "params": [
+                {"official_emails": email},
+                {
+                    "orcid": True,
+                    "name": True,
+                    "cid": { "name": True },
+                    "primary_email": True
+                }
+            ],
+            "session": session_token
+    }
+    pdb_headers = {
+        "Content-Type": "application/json"
+    }
+    primary_email = email
+    orcid = ''
+    try:
+        pdbperson_response = http_request('pdb', 'POST', pdb_url, hedge=True, headers=pdb_headers, data=json.dumps(pdbperson_payload))
+    except requests.exceptions.RequestException as e:
+        if backends.is_unavailable(e):
+            raise
+        print(f"ERROR: PDB person lookup for e-mail {email} failed ({e}), using input e-mail.")
+        return primary_email, orcid
+    if backends.is_failure(response=pdbperson_response):
+        pdbperson_response.raise_for_status()
+    if pdbperson_response.status_code in (401, 403) or ('session' in pdbperson_response.text.lower() and '"result"' not in pdbperson_response.text):
+        raise PDBSessionError(pdbperson_response.text)
+    if pdbperson_response.status_code == 200:
+        try:
+            pdbperson_result = pdbperson_response.json()
+            pdbperson = pdbperson_result['result'][0]
+            primary_email = pdbperson['primary_email']
+            print('Primary email in PDB: ' + primary_email)
+            if 'orcid' in pdbperson:
+                orcid = pdbperson['orcid']
+                print('Found ORCID in PDB: ' + orcid)
+        except ValueError:
+            print(pdbperson_response.text)
+            print(f"Invalid PDB response for e-mail {email}, using input e-mail.")
+        except (IndexError, KeyError):
+            print(f"Person with e-mail {email} not found in PDB, using input e-mail.")
+    else:
+        print(f"ERROR: PDB person lookup failed failed with status code {pdbperson_response.status_code}")
+    return primary_email, orcid
 
 def validate_input_file(filepath):
     """
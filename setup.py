@@ -16,6 +16,9 @@ setup(
         'requests',
         'python-dotenv'
     ],
+    extras_require={
+        'brotli': ['brotli']
+    },
     entry_points={
     'console_scripts': [
         'create-dmp=create_dmp.main:main'